@@ -0,0 +1,161 @@
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+
+# Allergen groups: every name in a group is expanded to the whole group, so
+# "peanut", "groundnut" and "moongphali" all exclude the same foods
+SYNONYMS = [
+    ['peanut', 'groundnut', 'moongphali', 'moongfali', 'mungfali', 'singdana'],
+    ['gluten', 'wheat', 'atta', 'maida', 'suji', 'sooji', 'semolina', 'rava', 'rawa', 'barley',
+     'rye', 'bread', 'roti', 'chapati', 'naan', 'paratha', 'parantha', 'puri', 'bhatura', 'noodle',
+     'pasta', 'biscuit', 'dalia'],
+    ['milk', 'dairy', 'lactose', 'paneer', 'curd', 'dahi', 'yogurt', 'yoghurt', 'ghee', 'butter',
+     'cheese', 'cream', 'khoa', 'khoya', 'lassi', 'raita', 'kheer', 'rabri', 'malai'],
+    ['egg', 'omelette', 'omelet', 'anda', 'mayonnaise'],
+    ['fish', 'salmon', 'tuna', 'pomfret', 'rohu', 'hilsa', 'mackerel', 'sardine', 'machli'],
+    ['shellfish', 'prawn', 'shrimp', 'crab', 'lobster', 'jhinga', 'oyster', 'mussel'],
+    ['tree nut', 'nut', 'almond', 'badam', 'cashew', 'kaju', 'walnut', 'akhrot', 'pistachio', 'pista',
+     'hazelnut', 'pecan'],
+    ['soy', 'soya', 'tofu', 'edamame'],
+    ['sesame', 'til', 'gingelly'],
+    ['mustard', 'sarson', 'rai'],
+]
+
+# Matched against food names like the allergens, so this also lists meat
+# dishes whose names do not say so (roghan josh, boti kebab, chops)
+_MEAT = ['chicken', 'mutton', 'lamb', 'goat', 'meat', 'keema', 'kheema', 'beef', 'pork', 'bacon',
+         'ham', 'salami', 'sausage', 'liver', 'brain', 'trotter', 'paya', 'duck', 'turkey', 'gelatin',
+         'roghan', 'boti', 'shammi', 'gushtaba', 'chop']
+
+# Words (or allergen groups) whose foods each diet preference leaves out
+DIET_EXCLUDES = {
+    'vegetarian': ['egg', 'fish', 'shellfish'] + _MEAT,
+    'vegan': ['egg', 'fish', 'shellfish', 'milk', 'honey'] + _MEAT,
+}
+
+_GROUPS = {}
+for _group in SYNONYMS:
+    for _name in _group:
+        _GROUPS[_name] = _group
+
+_TOKEN = re.compile(r'[a-z]+')
+
+
+def normalize(token):
+    """Fold simple English plurals so 'peanuts' and 'peanut' index the same"""
+    if len(token) > 4 and token.endswith('ies'):
+        return token[:-3] + 'y'
+    if len(token) > 4 and token.endswith(('ches', 'shes', 'sses', 'xes')):
+        return token[:-2]
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text):
+    return [normalize(t) for t in _TOKEN.findall(str(text).lower())]
+
+
+def parse_allergies(text):
+    """Allergen names from a comma-separated form field ('None' and blanks dropped)"""
+    if isinstance(text, str):
+        text = text.split(',')
+    return [a.strip() for a in text if a and a.strip() and a.strip().lower() != 'none']
+
+
+@lru_cache(maxsize=1024)
+def _expand(allergens):
+    terms = set()
+    for allergen in allergens:
+        key = ' '.join(tokenize(allergen))
+        for name in _GROUPS.get(key, [key]):
+            words = tuple(tokenize(name))
+            if words:
+                terms.add(words)
+    return tuple(sorted(terms))
+
+
+def diet_key(diet_pref):
+    """'vegetarian', 'vegan' or 'omnivore' from a form value such as 'Veg' or 'Non-Veg'"""
+    pref = (diet_pref or '').strip().lower()
+    if pref in ('veg', 'vegetarian'):
+        return 'vegetarian'
+    if pref == 'vegan':
+        return 'vegan'
+    return 'omnivore'
+
+
+def exclusions(diet_pref, allergies=()):
+    """Names whose foods a profile must not get: its allergens plus its diet preference's exclusions"""
+    return DIET_EXCLUDES.get(diet_key(diet_pref), []) + parse_allergies(allergies)
+
+
+def expand(allergens):
+    """Search terms (tuples of tokens) for a set of allergens, synonyms included"""
+    return _expand(frozenset(parse_allergies(allergens)))
+
+
+class AllergenIndex:
+    """Inverted index from food-name tokens to row numbers.
+
+    Texts are tokenized once; mask() then answers any allergen set with a
+    union of posting lists, without rescanning the strings. A sorted token
+    array with CSR offsets into the row postings is all it keeps.
+    """
+
+    def __init__(self, texts=None, arrays=None):
+        if arrays is None:
+            arrays = self.index_arrays(texts)
+        self.size = int(arrays['size'])
+        self.tokens, self.offsets, self.rows = arrays['tokens'], arrays['offsets'], arrays['rows']
+
+    @staticmethod
+    def index_arrays(texts):
+        postings = defaultdict(list)
+        n = 0
+        for i, text in enumerate(texts):
+            for token in set(tokenize(text)):
+                postings[token].append(i)
+            n += 1
+        tokens = sorted(postings)
+        offsets = np.zeros(len(tokens) + 1, dtype=np.int64)
+        np.cumsum([len(postings[t]) for t in tokens], out=offsets[1:])
+        rows = np.fromiter((i for t in tokens for i in postings[t]), dtype=np.int64, count=offsets[-1])
+        return {'size': np.array(n), 'tokens': np.array(tokens, dtype=str), 'offsets': offsets, 'rows': rows}
+
+    def _postings(self, token):
+        i = int(np.searchsorted(self.tokens, token))
+        if i < len(self.tokens) and self.tokens[i] == token:
+            return self.rows[self.offsets[i]:self.offsets[i + 1]]
+        return None
+
+    def _rows(self, words):
+        # Multi-word terms ("tree nut") need every word in the same text
+        rows = self._postings(words[0])
+        for word in words[1:]:
+            if rows is None:
+                break
+            other = self._postings(word)
+            rows = None if other is None else np.intersect1d(rows, other, assume_unique=True)
+        return rows
+
+    def mask(self, allergens):
+        """Boolean array, True for every text that mentions one of the allergens"""
+        hit = np.zeros(self.size, dtype=bool)
+        found = [rows for rows in map(self._rows, expand(allergens)) if rows is not None]
+        if found:
+            hit[np.concatenate(found)] = True
+        return hit
+
+
+@lru_cache(maxsize=4096)
+def _token_set(text):
+    return frozenset(tokenize(text))
+
+
+def mentions(text, allergens):
+    """Whether a single string mentions one of the allergens (for texts outside an index)"""
+    tokens = _token_set(str(text))
+    return any(all(w in tokens for w in words) for words in expand(allergens))
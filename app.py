@@ -1,20 +1,107 @@
 import streamlit as st
 import pandas as pd
 import numpy as np
-from sklearn.decomposition import NMF
-from sklearn.feature_extraction.text import TfidfVectorizer
+
+from allergens import AllergenIndex
+from dataset_cache import DatasetCache, file_stamp
+from patient_index import PatientIndex
+from plan_engine import DAYS, PlanEngine
+from topic_model import topic_model_for
+
+import os
+
+# Indexes and topic models kept per (file, version): every new version of a file
+# adds one, so the least recently used are dropped past this many
+INDEX_CACHE_ENTRIES = int(os.getenv('INDEX_CACHE_ENTRIES', '8'))
+
+@st.cache_data(max_entries=4)
+def list_csv_files(folder_mtime):
+	"""CSV files of the working folder, listed again only when the folder changes"""
+	return [f for f in os.listdir('.') if f.endswith('.csv')]
 
 # --- File selectors for user and food datasets ---
 st.sidebar.header('Dataset Selection')
-import os
-csv_files = [f for f in os.listdir('.') if f.endswith('.csv')]
+csv_files = list_csv_files(os.stat('.').st_mtime_ns)
 user_file = st.sidebar.selectbox('Select User Profile Dataset (INDB.csv)', csv_files, index=csv_files.index('INDB.csv') if 'INDB.csv' in csv_files else 0)
 food_file = st.sidebar.selectbox('Select Food/Nutrition Dataset (diet_recommendations_dataset.csv)', csv_files, index=csv_files.index('diet_recommendations_dataset.csv') if 'diet_recommendations_dataset.csv' in csv_files else 0)
 
 
-# Load user profile dataset
-user_df = pd.read_csv(user_file)
-user_df.columns = [col.strip().lower().replace(' ', '_') for col in user_df.columns]
+@st.cache_resource
+def shared_datasets():
+	"""Parsed datasets shared read-only by every session, within DATASET_CACHE_MB (LRU)"""
+	return DatasetCache()
+
+@st.cache_resource(max_entries=INDEX_CACHE_ENTRIES)
+def load_patient_index(path, stamp):
+	"""Nearest-neighbour index over a patient file, built once per file version"""
+	return PatientIndex(shared_datasets().get(path, normalize=True))
+
+@st.cache_resource(max_entries=INDEX_CACHE_ENTRIES)
+def load_allergen_index(path, stamp):
+	"""Allergen index over a food file's names, tokenized once per file version"""
+	return AllergenIndex(shared_datasets().get(path)['food_name'])
+
+@st.cache_resource
+def topic_model_registry():
+	"""Most recent mini-batch topic model in this process, the starting point for new datasets"""
+	return {}
+
+@st.cache_resource(max_entries=INDEX_CACHE_ENTRIES)
+def load_topic_model(path, stamp, column, mode):
+	"""TF-IDF/NMF topics for a dataset column, read from the shared model store or fitted once"""
+	texts = shared_datasets().get(path)[column].astype(str)
+	registry = topic_model_registry()
+	model = topic_model_for(path, column, texts, mode=mode, base=registry.get(mode))
+	if mode == 'minibatch':
+		registry[mode] = model
+	return model
+
+# Derived results are memoized by their inputs (file versions and widget
+# values), so a widget change only recomputes the stages that depend on it
+
+@st.cache_data(max_entries=256)
+def recommended_foods(path, stamp, allergies, diet_type):
+	"""Allergen-free foods for a diet type, the ten the meal plan is built from"""
+	diet_df = shared_datasets().get(path)
+	# Filter out allergen-containing foods (synonyms and plurals included)
+	food_df = diet_df[~load_allergen_index(path, stamp).mask(list(allergies))]
+
+	# Filter for diet type (simple example: low_carb, balanced, low_sodium)
+	if diet_type.lower() == 'low_carb':
+		food_df = food_df.sort_values('carb_g').head(10)
+	elif diet_type.lower() == 'low_sodium':
+		# If sodium column exists
+		sodium_col = None
+		for col in food_df.columns:
+			if 'sodium' in col.lower():
+				sodium_col = col
+				break
+		if sodium_col:
+			food_df = food_df.sort_values(sodium_col).head(10)
+	else:
+		# Balanced: pick top 10 foods by protein and fibre
+		if 'protein_g' in food_df.columns and 'fibre_g' in food_df.columns:
+			food_df = food_df.sort_values(['protein_g', 'fibre_g'], ascending=False).head(10)
+	return food_df
+
+@st.cache_data(max_entries=256)
+def seven_day_plan(path, stamp, allergies, diet_type, rec_cal):
+	"""7-day plan table over the recommended foods"""
+	# Servings chosen to hit the calorie target within the diet's nutrient limits
+	plan_rows = []
+	for day in PlanEngine(recommended_foods(path, stamp, allergies, diet_type)).build(rec_cal, diet_type):
+		day_plan = {'Day': day['day']}
+		for meal, item in day['meals'].items():
+			day_plan[meal] = f"{item['food_name']} ({item['servings']:g} {item['servings_unit']})"
+		day_plan['Calories (kcal)'] = round(day['totals']['energy_kcal'])
+		plan_rows.append(day_plan)
+	if not plan_rows:
+		plan_rows = [{'Day': day, 'Breakfast': 'N/A', 'Lunch': 'N/A', 'Dinner': 'N/A'} for day in DAYS]
+	return pd.DataFrame(plan_rows)
+
+# Load user profile dataset (parsed once per process, shared by every session)
+user_stamp = file_stamp(user_file)
+user_df = shared_datasets().get(user_file, normalize=True)
 st.write('Debug: user_df columns:', list(user_df.columns))
 if 'age' not in user_df.columns:
 	st.error(f"The selected user profile file '{user_file}' does not contain an 'age' column. Please select the correct file.")
@@ -22,7 +109,8 @@ if 'age' not in user_df.columns:
 
 # Load diet recommendations/recipes dataset
 try:
-	diet_df = pd.read_csv(food_file)
+	food_stamp = file_stamp(food_file)
+	diet_df = shared_datasets().get(food_file)
 except FileNotFoundError:
 	st.error(f'{food_file} not found. Please add it to the project folder.')
 	diet_df = None
@@ -98,20 +186,14 @@ if diet_df is not None:
 			break
 
 	if recipe_col:
-		tfidf = TfidfVectorizer(stop_words='english', max_features=100)
-		tfidf_matrix = tfidf.fit_transform(diet_df[recipe_col].astype(str))
-		n_topics = min(5, tfidf_matrix.shape[0])
-		nmf = NMF(n_components=n_topics, random_state=42)
-		W = nmf.fit_transform(tfidf_matrix)
-		H = nmf.components_
-		feature_names = tfidf.get_feature_names_out()
-		topics = []
-		for topic_idx, topic in enumerate(H):
-			top_terms = [feature_names[i] for i in topic.argsort()[:-6:-1]]
-			topics.append(', '.join(top_terms))
+		# Fitted once per (dataset, column, parameters) and shared by all sessions;
+		# reruns only read the model back
+		incremental = st.sidebar.checkbox('Update topics incrementally (mini-batch NMF)', value=False)
+		topic_model = load_topic_model(food_file, food_stamp, recipe_col,
+									   'minibatch' if incremental else 'batch')
 		st.subheader('Extracted Food Topics:')
-		for i, t in enumerate(topics):
-			st.write(f"Topic {i+1}: {t}")
+		for i, terms in enumerate(topic_model.topics()):
+			st.write(f"Topic {i+1}: {', '.join(terms)}")
 	else:
 		st.warning('No recipe/ingredient/description column found for feature extraction in diet dataset.')
 
@@ -120,66 +202,36 @@ if diet_df is not None:
 	st.header('Personalized Meal Plan & Grocery List')
 
 
-	# Normalize column names to avoid KeyError due to whitespace/case
-
-	user_df.columns = [col.strip().lower().replace(' ', '_') for col in user_df.columns]
-	st.write('Debug: user_df columns:', list(user_df.columns))
-	print('Debug: user_df columns:', list(user_df.columns))
-
 	# Map user input to dietary recommendation
-	# Find closest matching user in user_df
-	user_row = user_df.loc[(user_df['age'] == age) &
-						   (user_df['gender'].str.lower() == gender.lower()) &
-						   (user_df['height_cm'] == height) &
-						   (user_df['weight_kg'] == weight)]
-	if user_row.empty:
-		# If exact match not found, use only age/gender
-		user_row = user_df.loc[(user_df['age'] == age) & (user_df['gender'].str.lower() == gender.lower())]
-	if user_row.empty:
-		st.warning('No exact user profile match found. Using default: Balanced diet.')
+	# Find the most similar patients in user_df
+	if {'age', 'gender', 'height_cm', 'weight_kg'}.issubset(user_df.columns):
+		neighbours = load_patient_index(user_file, user_stamp).query(age, gender, height, weight, k=5)
+	else:
+		neighbours = pd.DataFrame()
+	if neighbours.empty:
+		st.warning('No similar user profile found. Using default: Balanced diet.')
 		diet_type = 'Balanced'
 		restrictions = []
 		allergies = []
 	else:
-		diet_type = user_row.iloc[0]['diet_recommendation'] if 'diet_recommendation' in user_row.columns else 'Balanced'
-		restrictions = []
-		if 'dietary_restrictions' in user_row.columns:
-			restrictions = str(user_row.iloc[0]['dietary_restrictions']).split(',')
-		allergies = []
-		if 'allergies' in user_row.columns:
-			allergies = str(user_row.iloc[0]['allergies']).split(',')
+		# Inverse-distance weighted vote over the neighbours
+		diet_type = PatientIndex.vote(neighbours, 'diet_recommendation') or 'Balanced'
+		restrictions = str(PatientIndex.vote(neighbours, 'dietary_restrictions') or 'None').split(',')
+		allergies = str(PatientIndex.vote(neighbours, 'allergies') or 'None').split(',')
+		st.subheader('Most Similar Patients:')
+		st.dataframe(neighbours)
 
 	st.write(f"**Diet Recommendation:** {diet_type}")
 	st.write(f"**Dietary Restrictions:** {', '.join([r for r in restrictions if r and r.lower() != 'none']) or 'None'}")
 	st.write(f"**Allergies:** {', '.join([a for a in allergies if a and a.lower() != 'none']) or 'None'}")
 
-	# Filter foods based on restrictions/allergies
-	food_df = diet_df.copy()
-	# Filter out allergen-containing foods
-	for allergen in allergies:
-		if allergen and allergen.lower() != 'none':
-			food_df = food_df[~food_df['food_name'].str.lower().str.contains(allergen.strip().lower())]
-
-	# Filter for diet type (simple example: low_carb, balanced, low_sodium)
 	# Determine diet_type from disease mapping
 	disease_map = {'None':'Balanced', 'Diabetes':'Low_Sugar', 'Hypertension':'Low_Sodium', 'Obesity':'Low_Carb'}
 	diet_type = disease_map.get(disease, 'Balanced')
 	st.write(f"**Diet Type Based on Disease:** {diet_type}")
-	if diet_type.lower() == 'low_carb':
-		food_df = food_df.sort_values('carb_g').head(10)
-	elif diet_type.lower() == 'low_sodium':
-		# If sodium column exists
-		sodium_col = None
-		for col in food_df.columns:
-			if 'sodium' in col.lower():
-				sodium_col = col
-				break
-		if sodium_col:
-			food_df = food_df.sort_values(sodium_col).head(10)
-	else:
-		# Balanced: pick top 10 foods by protein and fibre
-		if 'protein_g' in food_df.columns and 'fibre_g' in food_df.columns:
-			food_df = food_df.sort_values(['protein_g', 'fibre_g'], ascending=False).head(10)
+	# Foods without the allergens, filtered for the diet type
+	allergy_key = tuple(sorted({a.strip().lower() for a in allergies if a.strip()}))
+	food_df = recommended_foods(food_file, food_stamp, allergy_key, diet_type)
 
 	st.subheader('Recommended Foods for Your Meal Plan:')
 	st.dataframe(food_df[['food_name', 'energy_kcal', 'carb_g', 'protein_g', 'fat_g', 'fibre_g']].reset_index(drop=True))
@@ -187,22 +239,7 @@ if diet_df is not None:
 	# --- 7-Day Meal Plan (3 meals per day) ---
 	st.write('---')
 	st.subheader('7-Day Meal Plan (3 meals/day)')
-	import numpy as _np
-	days = ['Monday','Tuesday','Wednesday','Thursday','Friday','Saturday','Sunday']
-	meals = ['Breakfast','Lunch','Dinner']
-	plan_rows = []
-	for day in days:
-		day_plan = {'Day': day}
-		for meal in meals:
-			# randomly select a recommended food
-			if not food_df.empty:
-				idx = _np.random.randint(len(food_df))
-				day_plan[meal] = food_df.iloc[idx]['food_name']
-			else:
-				day_plan[meal] = 'N/A'
-		plan_rows.append(day_plan)
-	plan_df = pd.DataFrame(plan_rows)
-	st.table(plan_df)
+	st.table(seven_day_plan(food_file, food_stamp, allergy_key, diet_type, rec_cal))
 
 	# Instruction to user
 	st.write('---')
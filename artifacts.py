@@ -0,0 +1,33 @@
+import os
+import tempfile
+
+import joblib
+
+
+def save(obj, path):
+    """joblib.dump, written then renamed so concurrent readers never see a partial file"""
+    directory = os.path.dirname(path) or '.'
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    os.close(fd)
+    try:
+        joblib.dump(obj, tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def load_or_build(path, build):
+    """The object saved at path, or build()'s result, saved there for the next process"""
+    if os.path.exists(path):
+        try:
+            return joblib.load(path)
+        except Exception:
+            pass  # Corrupt or incompatible file: rebuild below
+    obj = build()
+    try:
+        save(obj, path)
+    except OSError:
+        pass  # Read-only deployment: keep the in-memory object
+    return obj
@@ -0,0 +1,57 @@
+import asyncio
+
+
+class MicroBatcher:
+    """Items queued by concurrent request handlers, handled by one process() call per batch.
+
+    A batch closes `delay` seconds after its first item arrives, or as soon
+    as it holds max_items; process() then runs off the event loop and each
+    caller's future gets the results of its own items.
+    """
+
+    def __init__(self, delay, max_items):
+        self.delay = delay
+        self.max_items = max_items
+        self._items = []
+        self._waiters = []
+        self._task = None
+        self._full = None
+
+    def pending(self):
+        """Items waiting for the next batch"""
+        return len(self._items)
+
+    def submit(self, items):
+        """Queue items; a future of their results, in order"""
+        future = asyncio.get_running_loop().create_future()
+        start = len(self._items)
+        self._items.extend(items)
+        self._waiters.append((future, start, len(self._items)))
+        if self._task is None:
+            self._full = asyncio.Event()
+            self._task = asyncio.ensure_future(self._flush())
+        if len(self._items) >= self.max_items:
+            self._full.set()
+        return future
+
+    def process(self, items):
+        """One result per item for the whole batch (runs in a worker thread)"""
+        raise NotImplementedError
+
+    async def _flush(self):
+        try:
+            await asyncio.wait_for(self._full.wait(), self.delay)
+        except asyncio.TimeoutError:
+            pass
+        items, waiters = self._items, self._waiters
+        self._items, self._waiters, self._task = [], [], None
+        try:
+            results = await asyncio.to_thread(self.process, items)
+        except Exception as exc:
+            for waiter, _, _ in waiters:
+                if not waiter.done():
+                    waiter.set_exception(exc)
+        else:
+            for waiter, start, end in waiters:
+                if not waiter.done():
+                    waiter.set_result(results[start:end])
@@ -0,0 +1,75 @@
+"""Cold-start cost of loading the CSV datasets: pd.read_csv vs the columnar cache.
+
+Each variant runs in a fresh interpreter so import caches and the page cache
+of the previous run do not leak into the numbers.
+
+    python benchmarks/bench_datasets.py [--repeat 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FILES = ['INDB.csv', 'Food_and_Nutrition__.csv', 'diet_recommendations_dataset.csv']
+
+CHILD = r'''
+import json, sys, time
+sys.path.insert(0, {root!r})
+import pandas as pd
+from datasets import load_csv
+
+def rss():
+    fields = {{}}
+    with open('/proc/self/status') as fh:
+        for line in fh:
+            key, _, value = line.partition(':')
+            fields[key] = value.strip()
+    return {{k: int(fields.get(k, '0 kB').split()[0]) for k in ('RssAnon', 'RssFile')}}
+
+before = rss()
+start = time.perf_counter()
+frames = [{loader}(f) for f in {files!r}]
+elapsed = time.perf_counter() - start
+# Touch every column, as request handlers eventually do
+for df in frames:
+    for c in df.columns:
+        if df[c].dtype.kind in 'fiu':
+            df[c].to_numpy().sum()
+after = rss()
+print(json.dumps({{
+    'seconds': elapsed,
+    'anon_kb': after['RssAnon'] - before['RssAnon'],
+    'file_kb': after['RssFile'] - before['RssFile'],
+}}))
+'''
+
+
+def run(loader, files):
+    code = CHILD.format(root=ROOT, loader=loader, files=files)
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                         capture_output=True, text=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    # Make sure the caches exist so the "after" runs measure warm starts
+    run('load_csv', FILES)
+
+    print(f"{'loader':<12}{'load ms':>10}{'private KB':>12}{'mapped KB':>12}")
+    for label, loader in (('read_csv', 'pd.read_csv'), ('load_csv', 'load_csv')):
+        runs = [run(loader, FILES) for _ in range(args.repeat)]
+        print(f"{label:<12}"
+              f"{statistics.median(r['seconds'] for r in runs) * 1000:>10.1f}"
+              f"{statistics.median(r['anon_kb'] for r in runs):>12.0f}"
+              f"{statistics.median(r['file_kb'] for r in runs):>12.0f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,89 @@
+"""Throughput of the diet classifier per request versus through the micro-batching queue.
+
+Each simulated request scores one profile, either with its own predict()
+call in a worker thread or through BatchPredictor, at several levels of
+concurrency. Runs offline against the cached model artifact.
+
+    python benchmarks/bench_diet_model.py [--concurrency 1,16,64,256] [--requests 2000]
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DISEASES = ['None', 'Diabetes', 'Hypertension', 'Obesity']
+ACTIVITY = ['Sedentary', 'Lightly Active', 'Moderately Active', 'Very Active']
+
+
+def profiles(diet_model, n, seed=0):
+    rng = random.Random(seed)
+    return [diet_model.profile_features(
+        rng.randint(18, 80), rng.choice(['Male', 'Female']), round(rng.uniform(17, 40), 1),
+        rng.choice(DISEASES), rng.choice(ACTIVITY),
+        glucose=rng.choice([None, round(rng.uniform(70, 200), 1)]),
+        blood_pressure=rng.choice([None, rng.randint(100, 180)]),
+    ) for _ in range(n)]
+
+
+async def run(predict, rows, concurrency):
+    queue = iter(rows)
+    latencies = []
+    results = []
+
+    async def worker():
+        for row in queue:
+            start = time.perf_counter()
+            results.append(await predict(row))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+    ms = np.array(latencies) * 1000
+    return {
+        'rps': len(rows) / elapsed,
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'fallbacks': sum(r is None for r in results),
+    }
+
+
+async def compare(diet_model, model, rows, levels, timeout):
+    async def single(row):
+        return (await asyncio.to_thread(model.predict, [row]))[0]
+
+    print(f"{'mode':<10}{'concurrency':>12}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'fallbacks':>11}")
+    for level in levels:
+        batcher = diet_model.BatchPredictor(model, timeout=timeout)
+        for mode, predict in (('single', single), ('batched', batcher.predict)):
+            stats = await run(predict, rows, level)
+            print(f"{mode:<10}{level:>12}{stats['rps']:>10.0f}{stats['p50_ms']:>10.2f}"
+                  f"{stats['p99_ms']:>10.2f}{stats['fallbacks']:>11}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', default='1,16,64,256',
+                        type=lambda s: [int(c) for c in s.split(',') if c])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--timeout', type=float, default=1.0,
+                        help='batched-call timeout in seconds (the server default is much lower)')
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    import diet_model
+    model = diet_model.diet_model_for()
+    print(f"model {model.meta.get('artifact')} cv accuracy {model.meta.get('cv_accuracy')}\n")
+    asyncio.run(compare(diet_model, model, profiles(diet_model, args.requests), args.concurrency, args.timeout))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
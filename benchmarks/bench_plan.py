@@ -0,0 +1,253 @@
+"""Micro-benchmarks of the /plan stages and a load test of the FastAPI app.
+
+Runs offline: Spoonacular is replaced by a local stub server with a fixed
+latency, and requests go through httpx's in-process ASGI transport. Results
+can be saved as a baseline and later runs compared against it; the script
+exits with status 1 when a metric regresses by more than --threshold.
+
+    python benchmarks/bench_plan.py --save-baseline
+    python benchmarks/bench_plan.py [--concurrency 1,8,32] [--requests 400] [--threshold 0.25]
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BASELINE = os.path.join(ROOT, 'benchmarks', 'baseline_plan.json')
+
+# Used when the checkout has no templates/ folder, so rendering is still timed
+FALLBACK_TEMPLATE = '''<h1>{{ name }}</h1><p>{{ bmi }} {{ bmi_cat }} {{ rec_cal }}</p>
+{% for row in plan %}<tr><td>{{ row.day }}</td><td>{{ row.Breakfast }}</td><td>{{ row.Lunch }}</td><td>{{ row.Dinner }}</td></tr>{% endfor %}
+{% for day in nutrient_plan %}{% for meal, food in day.meals.items() %}{{ meal }} {{ food.food_name }} {{ food.servings }}{% endfor %}{% endfor %}
+'''
+
+DISEASES = ['None', 'Diabetes', 'Hypertension', 'Obesity']
+GENDERS = ['Male', 'Female']
+PREFS = ['Non-Veg', 'Veg', 'Vegan']
+ACTIVITY = ['Sedentary', 'Lightly Active', 'Moderately Active', 'Very Active']
+ALLERGIES = ['None', 'None', 'peanut', 'milk, egg']
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Answers /recipes/complexSearch after a fixed delay"""
+    delay = 0.02
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        body = json.dumps({'results': [{'title': f'Stub recipe {i}'} for i in range(10)]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    # The default backlog of 5 drops connections under load and adds 1 s SYN retries
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def start_stub(delay):
+    StubHandler.delay = delay
+    server = StubServer(('127.0.0.1', 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def peak_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def profiles(n, seed=0):
+    rng = random.Random(seed)
+    return [{
+        'name': f'bench{i}',
+        'age': rng.randint(18, 80),
+        'gender': rng.choice(GENDERS),
+        'weight': round(rng.uniform(45, 120), 1),
+        'height': round(rng.uniform(150, 195), 1),
+        'disease': rng.choice(DISEASES),
+        'activity_level': rng.choice(ACTIVITY),
+        'allergies': rng.choice(ALLERGIES),
+        'diet_pref': rng.choice(PREFS),
+    } for i in range(n)]
+
+
+async def timed(fn, repeat, number):
+    """Median microseconds per call over `repeat` rounds of `number` calls"""
+    rounds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            result = fn()
+            if asyncio.iscoroutine(result):
+                await result
+        rounds.append((time.perf_counter() - start) / number * 1e6)
+    return statistics.median(rounds)
+
+
+async def micro(server, repeat):
+    p = profiles(1)[0]
+    targets = {k: v[0] for k, v in server.bmi_targets([p['weight']], [p['height']]).items()}
+    context = await server.build_plan(**p)
+    template = server.templates.get_template('result.html')
+
+    def upstream():
+        server.spoonacular.cache.clear()
+        return server.get_indian_meal_suggestions('Veg', 'None', 600, 'lunch')
+
+    cases = {
+        'bmi_targets': lambda: server.bmi_targets([p['weight']], [p['height']]),
+        'nutrient_plan': lambda: server.data.plan_engine.build(targets['rec_cal'], 'Balanced'),
+        'suggestions_cached': lambda: server.get_indian_meal_suggestions('Veg', 'None', 600, 'lunch'),
+        'suggestions_upstream': upstream,
+        'render': lambda: template.render({'request': None, **context}),
+        'build_plan': lambda: server.build_plan(**p),
+    }
+    if server.data.profile_index is not None:
+        cases['profile_lookup'] = lambda: server.data.profile_index.lookup(
+            'omnivore', p['gender'], p['activity_level'], p['disease'], p['age'], k=14)
+    results = {}
+    for name, fn in cases.items():
+        number = 5 if name == 'suggestions_upstream' else 50
+        results[name] = await timed(fn, repeat, number)
+    return results
+
+
+async def load(server, httpx, concurrency, n_requests):
+    transport = httpx.ASGITransport(app=server.app)
+    payloads = profiles(n_requests, seed=concurrency)
+    latencies = []
+    errors = 0
+    queue = iter(payloads)
+
+    async def worker(client):
+        nonlocal errors
+        for payload in queue:
+            start = time.perf_counter()
+            response = await client.post('/plan', data=payload)
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+        # Warm-up request so lazy pools and caches are not billed to the first worker
+        await client.post('/plan', data=payloads[0])
+        start = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - start
+    ms = np.array(latencies) * 1000
+    return {
+        'rps': n_requests / elapsed,
+        'p50_ms': float(np.percentile(ms, 50)),
+        'p95_ms': float(np.percentile(ms, 95)),
+        'p99_ms': float(np.percentile(ms, 99)),
+        'errors': errors,
+    }
+
+
+def compare(current, baseline, threshold):
+    """Metrics worse than the baseline by more than threshold, as printable lines"""
+    regressions = []
+
+    def check(label, new, old, higher_is_better=False):
+        if not old:
+            return
+        change = (old - new) / old if higher_is_better else (new - old) / old
+        if change > threshold:
+            regressions.append(f'{label}: {old:.1f} -> {new:.1f} ({change:+.0%})')
+
+    for name, us in current['micro'].items():
+        check(f'micro {name} us', us, baseline.get('micro', {}).get(name))
+    for level, stats in current['load'].items():
+        old = baseline.get('load', {}).get(level, {})
+        check(f'load c={level} rps', stats['rps'], old.get('rps'), higher_is_better=True)
+        for key in ('p50_ms', 'p95_ms', 'p99_ms'):
+            check(f'load c={level} {key}', stats[key], old.get(key))
+    check('peak_rss_kb', current['peak_rss_kb'], baseline.get('peak_rss_kb'))
+    return regressions
+
+
+async def run(args, server, httpx):
+    micro_results = await micro(server, args.repeat)
+    print(f"{'stage':<24}{'us/op':>12}")
+    for name, us in micro_results.items():
+        print(f'{name:<24}{us:>12.1f}')
+
+    load_results = {}
+    print(f"\n{'concurrency':<14}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for level in args.concurrency:
+        stats = load_results[str(level)] = await load(server, httpx, level, args.requests)
+        print(f"{level:<14}{stats['rps']:>10.1f}{stats['p50_ms']:>10.2f}"
+              f"{stats['p95_ms']:>10.2f}{stats['p99_ms']:>10.2f}{stats['errors']:>8}")
+    await server.spoonacular.aclose()
+    return {'micro': micro_results, 'load': load_results, 'peak_rss_kb': peak_rss_kb()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--concurrency', default='1,8,32',
+                        type=lambda s: [int(c) for c in s.split(',') if c])
+    parser.add_argument('--requests', type=int, default=400, help='requests per concurrency level')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--upstream-ms', type=float, default=20, help='stub Spoonacular latency')
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=0.25, help='allowed slowdown, 0.25 = 25%%')
+    args = parser.parse_args()
+
+    stub = start_stub(args.upstream_ms / 1000)
+    os.environ['SPOONACULAR_API_KEY'] = 'bench'
+    os.environ['SPOONACULAR_BASE_URL'] = f'http://127.0.0.1:{stub.server_port}'
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    random.seed(0)
+    import httpx
+    import main as server
+    if not os.path.exists(os.path.join(ROOT, 'templates', 'result.html')):
+        from fastapi.templating import Jinja2Templates
+        tmp = tempfile.mkdtemp(prefix='bench-templates-')
+        with open(os.path.join(tmp, 'result.html'), 'w') as fh:
+            fh.write(FALLBACK_TEMPLATE)
+        server.templates = Jinja2Templates(directory=tmp)
+        print('templates/result.html not found: rendering a minimal stand-in template\n')
+
+    current = asyncio.run(run(args, server, httpx))
+    print(f"\npeak RSS {current['peak_rss_kb'] / 1024:.1f} MB")
+    stub.shutdown()
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as fh:
+            json.dump(current, fh, indent=2)
+        print(f'baseline saved to {os.path.relpath(args.baseline, ROOT)}')
+        return 0
+    if not os.path.exists(args.baseline):
+        print('no baseline yet; run with --save-baseline to record one')
+        return 0
+    with open(args.baseline) as fh:
+        regressions = compare(current, json.load(fh), args.threshold)
+    if regressions:
+        print(f'\nregressions beyond {args.threshold:.0%}:')
+        print('\n'.join(f'  {r}' for r in regressions))
+        return 1
+    print(f'\nno regressions beyond {args.threshold:.0%}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
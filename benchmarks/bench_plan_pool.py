@@ -0,0 +1,129 @@
+"""Latency of light routes while /plan is under heavy load, per plan execution backend.
+
+A burst of concurrent /plan requests (monthly plans by default) is sent
+while a probe keeps requesting a static page, once for each backend of
+plan_workers.PlanPool. Reports the /plan status codes (503s are admission
+control at work), /plan latency and the probe's latency, whose tail shows
+how long the event loop was blocked.
+
+    python benchmarks/bench_plan_pool.py [--backends inline,thread,process] [--requests 200]
+        [--workers 2] [--queue 16] [--plan-type Monthly]
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import Counter
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Used when the checkout has no templates/ folder
+FALLBACK_TEMPLATES = {
+    'index.html': '<h1>Diet planner</h1>',
+    'result.html': '{% for row in plan %}<tr><td>{{ row.day }}</td><td>{{ row.Breakfast }}</td>'
+                   '<td>{{ row.Lunch }}</td><td>{{ row.Dinner }}</td></tr>{% endfor %}',
+}
+
+# Seconds between two requests of the static page probe
+PROBE_INTERVAL = 0.002
+
+DISEASES = ['None', 'Diabetes', 'Hypertension', 'Obesity']
+ALLERGIES = ['None', 'peanut', 'milk, egg']
+
+
+def forms(n, plan_type, seed=0):
+    rng = random.Random(seed)
+    return [{
+        'name': f'bench{i}', 'age': rng.randint(18, 80), 'gender': rng.choice(['Male', 'Female']),
+        'weight': round(rng.uniform(45, 120), 1), 'height': round(rng.uniform(150, 195), 1),
+        'disease': rng.choice(DISEASES), 'allergies': rng.choice(ALLERGIES), 'plan_type': plan_type,
+    } for i in range(n)]
+
+
+def ms(values, q):
+    return float(np.percentile(np.array(values) * 1000, q)) if values else float('nan')
+
+
+async def run(server, httpx, args):
+    from plan_workers import PlanPool
+    print(f"{'backend':<10}{'200':>6}{'503':>6}{'504':>6}{'plan p50':>10}{'plan p95':>10}"
+          f"{'page p50':>10}{'page p99':>10}{'page max':>10}")
+    for backend in args.backends:
+        server.plan_pool.shutdown()
+        server.plan_pool = PlanPool(backend, args.workers, args.queue, args.timeout, load=server.plan_pool.load)
+        transport = httpx.ASGITransport(app=server.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench', timeout=None) as client:
+            # Warm-up, so process workers have loaded their snapshot
+            await client.post('/plan', data=forms(1, args.plan_type)[0])
+            codes, plan_latency, page_latency = Counter(), [], []
+            done = asyncio.Event()
+
+            async def planner(form):
+                start = time.perf_counter()
+                response = await client.post('/plan', data=form)
+                codes[response.status_code] += 1
+                if response.status_code == 200:
+                    plan_latency.append(time.perf_counter() - start)
+
+            async def probe():
+                # In-process requests rarely yield to the loop, so a blocked loop
+                # shows up as a late wake-up: the page is due PROBE_INTERVAL after
+                # the previous one and its latency counts from then
+                while not done.is_set():
+                    start = time.perf_counter()
+                    await asyncio.sleep(PROBE_INTERVAL)
+                    await client.get('/')
+                    page_latency.append(time.perf_counter() - start - PROBE_INTERVAL)
+
+            probing = asyncio.ensure_future(probe())
+            await asyncio.gather(*(planner(f) for f in forms(args.requests, args.plan_type, seed=1)))
+            done.set()
+            await probing
+        print(f"{backend:<10}{codes[200]:>6}{codes[503]:>6}{codes[504]:>6}"
+              f"{ms(plan_latency, 50):>10.1f}{ms(plan_latency, 95):>10.1f}"
+              f"{ms(page_latency, 50):>10.2f}{ms(page_latency, 99):>10.2f}{max(page_latency) * 1000:>10.2f}")
+    server.plan_pool.shutdown()
+    print('\nlatencies in ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--backends', default='inline,thread,process', type=lambda s: [b for b in s.split(',') if b])
+    parser.add_argument('--requests', type=int, default=200, help='concurrent /plan requests')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--queue', type=int, default=16)
+    parser.add_argument('--timeout', type=float, default=30)
+    parser.add_argument('--plan-type', default='Monthly')
+    args = parser.parse_args()
+
+    os.environ['SPOONACULAR_API_KEY'] = ''
+    os.environ['DATA_WATCH_INTERVAL'] = '0'
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    import httpx
+    import main as server
+    tmp = None
+    if not all(os.path.exists(os.path.join(ROOT, 'templates', name)) for name in FALLBACK_TEMPLATES):
+        from fastapi.templating import Jinja2Templates
+        tmp = tempfile.mkdtemp(prefix='bench-templates-')
+        for name, text in FALLBACK_TEMPLATES.items():
+            with open(os.path.join(tmp, name), 'w') as fh:
+                fh.write(text)
+        server.templates = Jinja2Templates(directory=tmp)
+        print('templates/ not found: rendering minimal stand-in templates\n')
+    try:
+        asyncio.run(run(server, httpx, args))
+    finally:
+        if tmp:
+            shutil.rmtree(tmp, ignore_errors=True)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,68 @@
+"""Build time and lookup latency of the food substitution index as the food table grows.
+
+Larger tables are made by repeating the INDB rows with a few percent of
+random noise on every nutrient, so neighbourhoods stay realistic. Lookups
+are timed unfiltered and with the vegetarian exclusion mask applied.
+
+    python benchmarks/bench_substitutes.py [--sizes 1014,10000,100000] [--lookups 20000]
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def grow(df, n, features, seed=0):
+    """n rows resampled from df with multiplicative noise on the nutrient columns"""
+    rng = np.random.default_rng(seed)
+    out = df.iloc[rng.integers(0, len(df), n)].reset_index(drop=True)
+    noise = rng.normal(1.0, 0.03, size=(n, len(features))).clip(0.8, 1.2)
+    out[features] = out[features].to_numpy(dtype=float) * noise
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1014,10000,100000',
+                        type=lambda s: [int(c) for c in s.split(',') if c])
+    parser.add_argument('--lookups', type=int, default=20000)
+    args = parser.parse_args()
+
+    os.chdir(ROOT)
+    sys.path.insert(0, ROOT)
+    from allergens import DIET_EXCLUDES, AllergenIndex
+    from substitutes import FEATURES, TOP_K, SubstituteIndex
+
+    indb = pd.read_csv('INDB.csv')
+    features = [c for c in FEATURES if c in indb.columns]
+    print(f"{'foods':>8}{'build s':>10}{'MB':>8}{'lookup us':>12}{'veg lookup us':>15}{'veg hits':>10}")
+    for n in args.sizes:
+        df = indb if n == len(indb) else grow(indb, n, features)
+        start = time.perf_counter()
+        arrays = SubstituteIndex.index_arrays(df)
+        build = time.perf_counter() - start
+        index = SubstituteIndex(arrays=arrays)
+        veg = AllergenIndex(df['food_name']).mask(DIET_EXCLUDES['vegetarian'])
+        rows = np.random.default_rng(1).integers(0, n, args.lookups)
+
+        start = time.perf_counter()
+        for row in rows:
+            index.lookup(row, 10)
+        plain = (time.perf_counter() - start) / len(rows) * 1e6
+        start = time.perf_counter()
+        hits = sum(len(index.lookup(row, 10, veg)[0]) for row in rows)
+        filtered = (time.perf_counter() - start) / len(rows) * 1e6
+
+        size = sum(a.nbytes for a in arrays.values()) / 2 ** 20
+        print(f'{n:>8}{build:>10.2f}{size:>8.1f}{plain:>12.1f}{filtered:>15.1f}{hits / len(rows):>10.1f}')
+    print(f'\n{TOP_K} neighbours stored per food')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,93 @@
+"""Per-worker memory of the API with and without the shared indexes.
+
+Starts N fresh interpreters the way uvicorn starts its workers, imports
+main in each and reports how much memory the import cost, plus a digest of
+every dataset and index so all workers can be checked to see the same data.
+Exits with status 1 if any worker disagrees.
+
+    python benchmarks/bench_workers.py [--workers 4]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = r'''
+import hashlib, json, os, sys
+sys.path.insert(0, {root!r})
+os.chdir({root!r})
+import numpy as np, pandas as pd, fastapi, httpx, jinja2, sklearn
+
+def rollup():
+    fields = {{}}
+    with open('/proc/self/smaps_rollup') as fh:
+        for line in fh:
+            parts = line.split()
+            if len(parts) >= 2 and parts[0].endswith(':'):
+                fields[parts[0][:-1]] = int(parts[1])
+    return fields
+
+before = rollup()
+import main
+after = rollup()
+
+digest = hashlib.blake2b(digest_size=16)
+for df in (main.data.diet_df, main.data.profile_df):
+    digest.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+engine = main.data.plan_engine
+digest.update(np.ascontiguousarray(engine.per_serving).tobytes())
+digest.update(json.dumps([list(engine.names), list(engine.units)]).encode())
+digest.update(json.dumps(main.data.food_search.records(*main.data.food_search.search('dal', 20))).encode())
+digest.update(main.data.food_allergens.mask(['peanut', 'milk']).tobytes())
+index = main.data.profile_index
+digest.update(json.dumps([index.record(i) for i in range(len(index))]).encode())
+digest.update(main.data.profile_allergens.mask(['egg']).tobytes())
+print(json.dumps({{
+    'digest': digest.hexdigest(),
+    'private_kb': after['Private_Dirty'] - before['Private_Dirty'],
+    'pss_kb': after['Pss'] - before['Pss'],
+}}), flush=True)
+sys.stdin.read()  # stay alive until every worker has reported
+'''
+
+
+def start_workers(n, shared):
+    env = dict(os.environ, SHARED_INDEXES='1' if shared else '0')
+    code = CHILD.format(root=ROOT)
+    procs = [subprocess.Popen([sys.executable, '-c', code], cwd=ROOT, env=env, text=True,
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE) for _ in range(n)]
+    results = [json.loads(p.stdout.readline()) for p in procs]
+    for p in procs:
+        p.stdin.close()
+        p.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--workers', type=int, default=4)
+    args = parser.parse_args()
+
+    # Build the shared files once, as serve.py does in the parent
+    start_workers(1, shared=True)
+
+    digests = set()
+    print(f"{'indexes':<10}{'workers':>8}{'private KB/worker':>20}{'PSS KB/worker':>16}")
+    for label, shared in (('private', False), ('shared', True)):
+        results = start_workers(args.workers, shared)
+        digests.update(r['digest'] for r in results)
+        private = sum(r['private_kb'] for r in results) / len(results)
+        pss = sum(r['pss_kb'] for r in results) / len(results)
+        print(f'{label:<10}{args.workers:>8}{private:>20.0f}{pss:>16.0f}')
+    if len(digests) != 1:
+        print(f'workers disagree: {len(digests)} different digests')
+        return 1
+    print(f'all workers saw the same data ({digests.pop()})')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
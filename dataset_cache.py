@@ -0,0 +1,92 @@
+import os
+import threading
+from collections import OrderedDict
+
+from datasets import load_csv
+
+# Memory budget for the frames DatasetCache keeps, in MB
+DATASET_CACHE_MB = float(os.getenv('DATASET_CACHE_MB', '512'))
+
+
+def normalize_columns(columns):
+    """Column names stripped, lowercased and snake_cased ('Height cm' -> 'height_cm')"""
+    return [str(col).strip().lower().replace(' ', '_') for col in columns]
+
+
+def file_stamp(path):
+    """(size, mtime) of a file, part of every cache key so edited files are read again"""
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class DatasetCache:
+    """Parsed datasets shared read-only by every session of a process.
+
+    Frames are kept by path, file stamp and column normalization, with their
+    deep memory size counted against a budget; past it the least recently
+    used frames are dropped (the newest one is always kept). A file is parsed
+    once even when several sessions ask for it at the same time, and loading
+    a new version of a file drops the old one. Callers must not modify the
+    frames they get back.
+    """
+
+    def __init__(self, limit_mb=DATASET_CACHE_MB, loader=load_csv):
+        self.limit = int(limit_mb * 2 ** 20)
+        self.loader = loader
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._frames = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+
+    def _cached(self, key):
+        entry = self._frames.get(key)
+        if entry is None:
+            return None
+        self._frames.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def _drop(self, key):
+        _, nbytes = self._frames.pop(key)
+        self.size -= nbytes
+
+    def get(self, path, normalize=False):
+        """The frame of a CSV file, normalize=True for snake_case column names"""
+        key = (os.path.abspath(path), file_stamp(path), normalize)
+        with self._lock:
+            df = self._cached(key)
+            if df is not None:
+                return df
+            loading = self._loading.setdefault(key, threading.Lock())
+        # One loader per key; sessions asking for the same file wait for it
+        with loading:
+            with self._lock:
+                df = self._cached(key)
+                if df is not None:
+                    return df
+            try:
+                df = self.loader(path)
+                if normalize:
+                    df.columns = normalize_columns(df.columns)
+                nbytes = int(df.memory_usage(deep=True).sum())
+                with self._lock:
+                    self.misses += 1
+                    for old in [k for k in self._frames if k[0] == key[0] and k[1] != key[1]]:
+                        self._drop(old)
+                    self._frames[key] = (df, nbytes)
+                    self.size += nbytes
+                    while self.size > self.limit and len(self._frames) > 1:
+                        self._drop(next(iter(self._frames)))
+                        self.evictions += 1
+            finally:
+                with self._lock:
+                    self._loading.pop(key, None)
+        return df
+
+    def stats(self):
+        with self._lock:
+            return {'frames': len(self._frames), 'mb': round(self.size / 2 ** 20, 1), 'limit_mb': round(self.limit / 2 ** 20, 1),
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
@@ -0,0 +1,207 @@
+import csv
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+# Bump when the on-disk layout changes so old caches are rebuilt
+CACHE_VERSION = 2
+
+# Superseded versions of a file's cache are removed once they are this old
+# (seconds), so a process still mapping one is not pulled from under it
+PRUNE_AFTER = 600
+
+
+def read_header(path):
+    """Column names of a CSV file, reading only its first line"""
+    with open(path, newline='', encoding='utf-8-sig') as fh:
+        return next(csv.reader(fh), [])
+
+
+def fingerprint(path, chunk_size=1 << 20):
+    """Content hash of a file"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def cache_dir(path):
+    """Columnar cache directory kept next to the CSV (INDB.csv -> .INDB.csv.cols)"""
+    head, tail = os.path.split(os.path.abspath(path))
+    return os.path.join(head, f'.{tail}.cols')
+
+
+def load_csv(path, use_cache=True):
+    """Read a CSV through its columnar cache, building the cache when missing or stale.
+
+    Numeric columns come back as read-only memory maps of the cached .npy
+    files; text columns are dictionary-encoded on disk and decoded on load.
+
+    Each content version of the file gets its own directory under the cache
+    (.INDB.csv.cols/<fingerprint>/), published with a single rename and never
+    modified afterwards, and current.json points at the version for the
+    file's size/mtime. Processes racing on a changed file build it once under
+    a file lock; the others wait and map the finished directory.
+    """
+    if not use_cache:
+        return pd.read_csv(path)
+    root = cache_dir(path)
+    st = os.stat(path)
+    current = _read_json(os.path.join(root, 'current.json'))
+    if current is not None and (current.get('size'), current.get('mtime_ns')) == (st.st_size, st.st_mtime_ns):
+        target = os.path.join(root, current['fingerprint'])
+        meta = _read_meta(target)
+        if meta is not None:
+            return _load(target, meta)
+    # New, changed or merely touched file: find its version by content
+    digest = fingerprint(path)
+    target = os.path.join(root, digest)
+    meta = _read_meta(target)
+    try:
+        if meta is None:
+            meta = _build_locked(path, root, digest, st)
+        _write_json(os.path.join(root, 'current.json'),
+                    {'fingerprint': digest, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns})
+    except OSError:
+        if meta is None:
+            # Read-only checkout: serve the CSV directly
+            return pd.read_csv(path)
+    return _load(target, meta)
+
+
+def _read_json(path):
+    try:
+        with open(path) as fh:
+            return json.load(fh)
+    except (OSError, ValueError):
+        return None
+
+
+def _read_meta(target):
+    meta = _read_json(os.path.join(target, 'meta.json'))
+    return meta if meta is not None and meta.get('version') == CACHE_VERSION else None
+
+
+def _write_json(path, obj):
+    # A private temp name, so concurrent writers never rename each other's file
+    fd, tmp = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            json.dump(obj, fh)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.unlink(tmp)
+        raise
+
+
+def _build_locked(path, root, digest, st):
+    """Build the version directory of a fingerprint unless another process already has"""
+    os.makedirs(root, exist_ok=True)
+    with open(os.path.join(root, '.lock'), 'w') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        target = os.path.join(root, digest)
+        meta = _read_meta(target)
+        if meta is None:
+            meta = _build(path, target, digest, st)
+            _prune(root, keep=digest)
+    return meta
+
+
+def _prune(root, keep):
+    """Remove files of the old single-directory layout and versions unused for PRUNE_AFTER seconds"""
+    now = time.time()
+    for entry in os.listdir(root):
+        full = os.path.join(root, entry)
+        if entry in (keep, 'current.json', '.lock'):
+            continue
+        if os.path.isdir(full):
+            try:
+                if now - os.stat(full).st_mtime > PRUNE_AFTER:
+                    shutil.rmtree(full, ignore_errors=True)
+            except OSError:
+                pass
+        elif entry == 'meta.json' or entry.endswith('.npy'):
+            os.unlink(full)
+
+
+def _build(path, target, digest, st):
+    df = pd.read_csv(path)
+    parent = os.path.dirname(target)
+    tmp = tempfile.mkdtemp(prefix='.' + os.path.basename(target) + '.', dir=parent)
+    os.chmod(tmp, 0o755)
+    try:
+        # One Fortran-ordered matrix per numeric dtype and one for the text
+        # codes, so every column is a contiguous slice of a single mapping
+        columns, numeric, codes, strings = [], {}, [], []
+        n_strings = 0
+        for name in df.columns:
+            col = df[name]
+            if pd.api.types.is_numeric_dtype(col):
+                values = col.to_numpy()
+                group = numeric.setdefault(values.dtype.str, [])
+                columns.append({'name': name, 'kind': 'num', 'dtype': values.dtype.str, 'slot': len(group)})
+                group.append(values)
+            else:
+                col_codes, uniques = pd.factorize(col.astype(object))
+                columns.append({'name': name, 'kind': 'str', 'slot': len(codes),
+                                'start': n_strings, 'stop': n_strings + len(uniques)})
+                codes.append(col_codes.astype(np.int32))
+                strings.append(np.asarray(uniques, dtype=str))
+                n_strings += len(uniques)
+        for dtype, group in numeric.items():
+            np.save(os.path.join(tmp, f'num{np.dtype(dtype).str[1:]}.npy'), np.column_stack(group).astype(dtype, order='F'))
+        if codes:
+            np.save(os.path.join(tmp, 'codes.npy'), np.asfortranarray(np.column_stack(codes)))
+            np.save(os.path.join(tmp, 'strings.npy'), np.concatenate(strings) if n_strings else np.array([], dtype=str))
+        meta = {
+            'version': CACHE_VERSION,
+            'fingerprint': digest,
+            'size': st.st_size,
+            'mtime_ns': st.st_mtime_ns,
+            'rows': len(df),
+            'columns': columns,
+        }
+        _write_json(os.path.join(tmp, 'meta.json'), meta)
+        # Publish the finished version with one rename (under the build lock,
+        # so only a stale directory of an older layout can be in the way)
+        if os.path.isdir(target):
+            stale = tempfile.mkdtemp(prefix='.stale.', dir=parent)
+            os.replace(target, os.path.join(stale, 'old'))
+            shutil.rmtree(stale, ignore_errors=True)
+        os.replace(tmp, target)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return meta
+
+
+def _load(target, meta):
+    def mapped(fname):
+        return np.load(os.path.join(target, fname), mmap_mode='r').view(np.ndarray)
+
+    numeric, codes, strings = {}, None, None
+    data = {}
+    for col in meta['columns']:
+        if col['kind'] == 'num':
+            if col['dtype'] not in numeric:
+                numeric[col['dtype']] = mapped(f"num{np.dtype(col['dtype']).str[1:]}.npy")
+            data[col['name']] = numeric[col['dtype']][:, col['slot']]
+        else:
+            if codes is None:
+                codes = mapped('codes.npy')
+                strings = np.load(os.path.join(target, 'strings.npy')).astype(object)
+            col_codes = codes[:, col['slot']]
+            uniques = strings[col['start']:col['stop']]
+            decoded = uniques[col_codes] if len(uniques) else np.empty(len(col_codes), dtype=object)
+            decoded[col_codes < 0] = np.nan
+            data[col['name']] = decoded
+    return pd.DataFrame(data, index=pd.RangeIndex(meta['rows']), copy=False)
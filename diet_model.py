@@ -0,0 +1,196 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import artifacts
+import metrics
+from batching import MicroBatcher
+from datasets import fingerprint
+
+DATA_PATH = 'diet_recommendations_dataset.csv'
+
+# Fitted artifacts, one file per (model version, data, params)
+MODEL_DIR = os.getenv('DIET_MODEL_DIR', '.diet_models')
+
+# Bump when the features or the pipeline change; part of every artifact's name
+MODEL_VERSION = 2
+
+# Clinical measurements only: with Disease_Type as an input the model would just
+# relearn the disease -> diet table (the dataset's labels follow it exactly)
+NUMERIC = ['BMI', 'Glucose_mg/dL', 'Cholesterol_mg/dL', 'Blood_Pressure_mmHg']
+CATEGORICAL = ['Severity', 'Physical_Activity_Level']
+FEATURES = NUMERIC + CATEGORICAL
+LABEL = 'Diet_Recommendation'
+
+# /plan activity levels -> the dataset's three levels
+ACTIVITY_LEVELS = {
+    'sedentary': 'Sedentary',
+    'lightly active': 'Moderate',
+    'moderately active': 'Moderate',
+    'very active': 'Active',
+}
+
+# Cross-validated accuracy a model needs before /plan serves it; below this the
+# queueing is not worth it and diet types come from the disease table. On the
+# bundled dataset the clinical features reach about 0.40 (three classes), so
+# the model is trained and reported but not served.
+MIN_ACCURACY = float(os.getenv('DIET_MODEL_MIN_ACCURACY', '0.6'))
+
+# Micro-batching: calls within BATCH_DELAY seconds share one predict; callers
+# give up (and fall back) after BATCH_TIMEOUT seconds
+BATCH_DELAY = float(os.getenv('DIET_BATCH_DELAY', '0.002'))
+BATCH_TIMEOUT = float(os.getenv('DIET_BATCH_TIMEOUT', '0.05'))
+MAX_BATCH = int(os.getenv('DIET_MAX_BATCH', '256'))
+MAX_PENDING = int(os.getenv('DIET_MAX_PENDING', '4096'))
+
+BATCH_SIZES = metrics.Histogram('diet_model_batch_size', 'Profiles per diet model predict call', label='model',
+                                buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+metrics.REGISTRY.append(BATCH_SIZES)
+
+
+def profile_features(age, gender, bmi, disease=None, activity_level=None, severity=None,
+             glucose=None, cholesterol=None, blood_pressure=None):
+    """Model input row for one profile; unknown measurements are imputed by the model
+    and keys outside FEATURES are ignored"""
+    return {
+        'Age': age,
+        'BMI': bmi,
+        'Glucose_mg/dL': glucose,
+        'Cholesterol_mg/dL': cholesterol,
+        'Blood_Pressure_mmHg': blood_pressure,
+        'Disease_Type': disease or 'None',
+        'Severity': severity,
+        'Physical_Activity_Level': ACTIVITY_LEVELS.get(str(activity_level).lower(), activity_level),
+        'Gender': gender,
+    }
+
+
+def _number(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return np.nan
+
+
+def to_frame(rows):
+    """Feature frame of many rows, built column by column (None -> NaN)"""
+    rows = list(rows)
+    data = {c: np.array([_number(r.get(c)) for r in rows], dtype=float) for c in NUMERIC}
+    for c in CATEGORICAL:
+        data[c] = np.array([np.nan if r.get(c) is None else str(r.get(c)) for r in rows], dtype=object)
+    return pd.DataFrame(data, copy=False)
+
+
+class DietModel:
+    """Diet type classifier over the clinical features of diet_recommendations_dataset.csv.
+
+    Missing measurements are imputed with the training medians and unseen
+    categories ignored, so a profile with only the /plan form's fields can
+    still be scored; predict() takes a whole batch of rows at once.
+    """
+
+    def __init__(self, C=1.0, random_state=42):
+        self.params = {'C': C, 'random_state': random_state}
+        self.pipeline = None
+        self.meta = {}
+
+    def fit(self, df):
+        # scikit-learn is only needed to fit; importing it costs about a second
+        from sklearn.compose import make_column_transformer
+        from sklearn.impute import SimpleImputer
+        from sklearn.linear_model import LogisticRegression
+        from sklearn.model_selection import cross_val_score
+        from sklearn.pipeline import make_pipeline
+        from sklearn.preprocessing import OneHotEncoder, StandardScaler
+
+        X = to_frame(df[FEATURES].to_dict('records'))
+        y = df[LABEL].astype(str)
+        self.pipeline = make_pipeline(
+            make_column_transformer(
+                (make_pipeline(SimpleImputer(strategy='median'), StandardScaler()), NUMERIC),
+                (make_pipeline(SimpleImputer(strategy='constant', fill_value='missing'),
+                               OneHotEncoder(handle_unknown='ignore')), CATEGORICAL),
+            ),
+            LogisticRegression(C=self.params['C'], max_iter=1000, random_state=self.params['random_state']),
+        )
+        accuracy = cross_val_score(self.pipeline, X, y, cv=5).mean() if y.value_counts().min() >= 5 else None
+        self.pipeline.fit(X, y)
+        self.meta = {
+            'version': MODEL_VERSION,
+            'trained_at': time.time(),
+            'rows': len(df),
+            'classes': self.pipeline.classes_.tolist(),
+            'cv_accuracy': None if accuracy is None else round(float(accuracy), 4),
+        }
+        return self
+
+    def serves(self):
+        """Whether the model is accurate enough (MIN_ACCURACY) to be used instead of the disease table"""
+        accuracy = self.meta.get('cv_accuracy')
+        return accuracy is not None and accuracy >= MIN_ACCURACY
+
+    def predict(self, rows):
+        """Diet type of each feature row (see profile_features())"""
+        rows = list(rows)
+        if not rows:
+            return []
+        BATCH_SIZES.observe('diet', len(rows))
+        return self.pipeline.predict(to_frame(rows)).tolist()
+
+
+def model_path(data_path, model_dir=MODEL_DIR, **params):
+    """Artifact path: model version plus a hash of the data's content and the hyperparameters"""
+    spec = json.dumps({'data': fingerprint(data_path), **params}, sort_keys=True)
+    return os.path.join(model_dir, f'diet-v{MODEL_VERSION}-{hashlib.blake2b(spec.encode(), digest_size=12).hexdigest()}.joblib')
+
+
+def diet_model_for(data_path=DATA_PATH, model_dir=MODEL_DIR, **params):
+    """The fitted model for this dataset and parameters, training only when no artifact exists"""
+    model = DietModel(**params)
+    path = model_path(data_path, model_dir, **model.params)
+
+    def fit():
+        # 'None' is a disease type here, not a missing value
+        model.fit(pd.read_csv(data_path, keep_default_na=False, na_values=['']))
+        model.meta['artifact'] = os.path.basename(path)
+        return model
+
+    return artifacts.load_or_build(path, fit)
+
+
+class BatchPredictor(MicroBatcher):
+    """Micro-batching front of a model for request handlers.
+
+    Calls arriving within `delay` seconds of a batch's first one (or until
+    max_batch rows) share one vectorized predict(), run off the event loop.
+    A call not answered within `timeout` seconds, or made while max_pending
+    rows are already waiting, gets None so the caller can fall back.
+    """
+
+    def __init__(self, model, delay=BATCH_DELAY, timeout=BATCH_TIMEOUT, max_batch=MAX_BATCH, max_pending=MAX_PENDING):
+        super().__init__(delay, max_batch)
+        self.model = model
+        self.timeout = timeout
+        self.max_pending = max_pending
+
+    async def predict(self, row):
+        """Prediction for one row, or None when the model is busy, slow or failing"""
+        if self.pending() >= self.max_pending:
+            return None
+        future = self.submit([row])
+        try:
+            labels = await asyncio.wait_for(asyncio.shield(future), self.timeout)
+        except asyncio.TimeoutError:
+            return None
+        return labels[0]
+
+    def process(self, rows):
+        try:
+            return self.model.predict(rows)
+        except Exception:
+            return [None] * len(rows)
@@ -0,0 +1,164 @@
+import re
+from collections import defaultdict
+from functools import lru_cache
+
+import numpy as np
+
+from shared import StringArray
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+# Rows whose trigram overlap with the query is below this are dropped unless
+# one of their words starts with a query word
+MIN_SIMILARITY = 0.4
+
+
+def words(text):
+    return _WORD.findall(str(text).lower())
+
+
+def trigrams(text):
+    """Padded character trigrams of every word ('dal' -> '  d', ' da', 'dal', 'al ')"""
+    grams = set()
+    for word in words(text):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class FoodSearch:
+    """Prefix and trigram index over food names and codes for autocomplete.
+
+    Word prefixes are answered with a binary search over the sorted vocabulary
+    and misspellings through trigram overlap, so a query never scans the names.
+    Codes are looked up in a sorted key array; the frame is only read for
+    the extra columns records() returns.
+    """
+
+    def __init__(self, df, name_col='food_name', code_col='food_code', arrays=None):
+        if arrays is None:
+            arrays = self.index_arrays(df, name_col, code_col)
+        self.df = df
+        self.names = StringArray.from_arrays(arrays, 'names')
+        self.codes = StringArray.from_arrays(arrays, 'codes')
+        self.size = len(self.names)
+        self.vocabulary, self.offsets, self.postings = arrays['vocabulary'], arrays['offsets'], arrays['postings']
+        self.gram_keys, self.gram_offsets, self.gram_rows = arrays['gram_keys'], arrays['gram_offsets'], arrays['gram_rows']
+        self.code_keys, self.code_order = arrays['code_keys'], arrays['code_order']
+        self.n_grams = arrays['n_grams']
+        self.name_length = arrays['name_length']
+        self._columns = {}
+        self.search = lru_cache(maxsize=4096)(self._search)
+
+    @staticmethod
+    def index_arrays(df, name_col='food_name', code_col='food_code'):
+        """The index as flat arrays: sorted keys with their postings laid out back to back"""
+        names = df[name_col].fillna('').astype(str).str.strip().tolist()
+        codes = df[code_col].fillna('').astype(str).tolist() if code_col in df.columns else [''] * len(df)
+
+        vocabulary = defaultdict(set)
+        grams = defaultdict(list)
+        n_grams = np.zeros(len(names), dtype=np.int32)
+        for i, (name, code) in enumerate(zip(names, codes)):
+            for word in words(name) + words(code):
+                vocabulary[word].add(i)
+            row_grams = trigrams(name)
+            n_grams[i] = len(row_grams)
+            for gram in row_grams:
+                grams[gram].append(i)
+
+        def flatten(table):
+            # Sorted keys, so the words sharing a prefix are one contiguous slice
+            keys = sorted(table)
+            postings = [sorted(table[k]) for k in keys]
+            offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+            np.cumsum([len(p) for p in postings], out=offsets[1:])
+            rows = np.fromiter((i for p in postings for i in p), dtype=np.int32, count=offsets[-1])
+            return np.array(keys, dtype=str), offsets, rows
+
+        vocabulary, offsets, postings = flatten(vocabulary)
+        gram_keys, gram_offsets, gram_rows = flatten(grams)
+        upper = np.array([c.upper() for c in codes], dtype=str)
+        code_order = np.argsort(upper, kind='stable')
+        return {
+            **StringArray.pack(names).arrays('names'),
+            **StringArray.pack(codes).arrays('codes'),
+            'vocabulary': vocabulary, 'offsets': offsets, 'postings': postings,
+            'gram_keys': gram_keys, 'gram_offsets': gram_offsets, 'gram_rows': gram_rows,
+            'code_keys': upper[code_order], 'code_order': code_order,
+            'n_grams': n_grams,
+            'name_length': np.array([len(n) for n in names], dtype=np.int32),
+        }
+
+    def __len__(self):
+        return self.size
+
+    def _prefix_rows(self, word):
+        lo, hi = np.searchsorted(self.vocabulary, [word, word + '\uffff'])
+        return self.postings[self.offsets[lo]:self.offsets[hi]]
+
+    def _gram_rows(self, gram):
+        i = int(np.searchsorted(self.gram_keys, gram))
+        if i < len(self.gram_keys) and self.gram_keys[i] == gram:
+            return self.gram_rows[self.gram_offsets[i]:self.gram_offsets[i + 1]]
+        return None
+
+    def _code_rows(self, code):
+        if not code:
+            return []
+        lo, hi = int(np.searchsorted(self.code_keys, code, 'left')), int(np.searchsorted(self.code_keys, code, 'right'))
+        return self.code_order[lo:hi]
+
+    def find_code(self, code):
+        """Row of a food code (case-insensitive), or None"""
+        rows = self._code_rows(str(code).strip().upper())
+        return int(rows[0]) if len(rows) else None
+
+    def _search(self, query, limit=10):
+        """Row numbers and scores of the best matches, best first"""
+        query_words = words(query)
+        if not query_words or not self.size:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        score = np.zeros(self.size)
+
+        # Typo tolerance: share of the query's trigrams found in the name
+        query_grams = trigrams(query)
+        hits = [rows for rows in map(self._gram_rows, query_grams) if rows is not None]
+        if hits:
+            shared = np.bincount(np.concatenate(hits), minlength=self.size)
+            candidates = np.flatnonzero(shared >= MIN_SIMILARITY * len(query_grams))
+            shared = shared[candidates]
+            similarity = shared / len(query_grams)
+            # Small penalty for long names so "dal" ranks "Dal" above "Dal makhani with rice"
+            similarity -= 0.1 * (1 - shared / np.maximum(self.n_grams[candidates], 1))
+            keep = similarity >= MIN_SIMILARITY
+            score[candidates[keep]] = similarity[keep]
+
+        # Every query word that starts a word of the name (or code) adds a point
+        for word in query_words:
+            score[self._prefix_rows(word)] += 1.0 / len(query_words)
+        # An exact food code wins outright
+        score[self._code_rows(query.strip().upper())] += 2.0
+
+        rows = np.flatnonzero(score > 0)
+        if len(rows) > limit:
+            rows = rows[np.argpartition(-score[rows], limit - 1)[:limit]]
+        rows = rows[np.lexsort((self.name_length[rows], -score[rows]))]
+        return rows, score[rows]
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = self.df[name].to_numpy()
+        return self._columns[name]
+
+    def records(self, rows, scores, fields=()):
+        """Result dicts with the food code, name, score and the requested columns"""
+        columns = [(f, self.column(f)) for f in fields]
+        results = []
+        for row, score in zip(rows, scores):
+            record = {'food_code': self.codes[row], 'food_name': self.names[row], 'score': round(float(score), 3)}
+            for field, values in columns:
+                value = values[row]
+                record[field] = None if value != value else value.item() if hasattr(value, 'item') else value
+            results.append(record)
+        return results
@@ -1,18 +1,33 @@
 from fastapi import FastAPI, Form, Request, HTTPException
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-import pandas as pd
+from pydantic import BaseModel, Field, ValidationError
+import asyncio
+import codecs
+import functools
+import hmac
+import itertools
+import json
+import tempfile
 import numpy as np
-import random
-import re
 import os
-import glob
-import requests
-from datetime import datetime, timedelta
+import threading
+from collections import Counter
+from datetime import date
+from typing import List, Optional
+
+from allergens import diet_key, exclusions, mentions, parse_allergies
+from diet_model import profile_features
+from meal_client import SpoonacularClient
+import metrics
+from progress_store import PERIODS, BatchWriter, ProgressStore, to_rows
+from plan_workers import PLAN_RETRY_AFTER, PlanPool, PlanTimeout, PoolSaturated, StaleSnapshot, compose_plan, household_shopping, load_snapshot, plan_chunk, plan_chunks
+from rotation import MAX_PLAN_DAYS, NO_REPEAT_DAYS, plan_length
+from substitutes import TOP_K
 
 app = FastAPI()
-app.mount("/static", StaticFiles(directory="static"), name="static")
+app.mount("/static", StaticFiles(directory="static", check_dir=False), name="static")
 templates = Jinja2Templates(directory="templates")
 
 def get_youtube_recipe_link(recipe_name):
@@ -25,42 +40,90 @@ def get_youtube_recipe_link(recipe_name):
     query = recipe_name.replace(' ', '+')
     return f"https://www.youtube.com/results?search_query={query}+recipe+indian+cooking"
 
-# Load datasets
-try:
-    diet_df = pd.read_csv("INDB.csv")
-except Exception:
-    diet_df = pd.DataFrame()
-
-# Optionally load a profile-based suggestions dataset if present
-profile_df = pd.DataFrame()
-candidate_names = [
-    "Food_and_Nutrition__.csv",  # your uploaded file
-    "profile_meal_suggestions.csv",
-    "meal_suggestions.csv",
-    "dietary_profile_suggestions.csv",
-    "meal_recommendations.csv",
-]
-for fname in candidate_names:
-    if os.path.exists(fname):
+SEARCH_FIELDS = 'energy_kcal,protein_g,carb_g,fat_g'
+
+# Datasets and their indexes (None until the first load); load_data() swaps in a
+# new snapshot on reload. snapshot and the model libraries are imported there,
+# so with LAZY_STARTUP the server binds before paying for those imports
+data = None
+
+# LAZY_STARTUP=1 binds the server first and loads the data in a background
+# thread; requests that need it wait (see wait_for_data) until it is ready
+LAZY_STARTUP = os.getenv('LAZY_STARTUP', '0') == '1'
+READY_TIMEOUT = float(os.getenv('READY_TIMEOUT', '30'))
+READY_MAX_WAITERS = int(os.getenv('READY_MAX_WAITERS', '256'))
+
+# Load and reload state reported by /readyz
+data_status = {'state': 'pending', 'errors': [], 'warnings': [], 'seconds': None,
+               'loaded_at': None, 'reloading': False, 'reload_errors': []}
+_data_ready = threading.Event()
+_ready_event = None
+_ready_waiters = 0
+_reload_lock = threading.Lock()
+
+# Reloads come from POST /admin/reload (X-Admin-Token: $ADMIN_TOKEN) or from a
+# watcher polling the source files every DATA_WATCH_INTERVAL seconds (0: off)
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
+DATA_WATCH_INTERVAL = float(os.getenv('DATA_WATCH_INTERVAL', '5'))
+_watcher = None
+
+# Members one /shopping/list request may plan for
+HOUSEHOLD_MAX = int(os.getenv('HOUSEHOLD_MAX', '50'))
+
+def load_data(wait=True):
+    """Build a new snapshot and publish it; returns False when it was rejected.
+
+    Once data has been served, a reload that fails validation keeps the
+    previous snapshot and only reports its errors. With wait=False, returns
+    None at once when another load is running.
+    """
+    global data
+    if not _reload_lock.acquire(blocking=wait):
+        return None
+    try:
+        first = data_status['state'] != 'ready'
+        if first:
+            data_status['state'] = 'loading'
+        data_status['reloading'] = not first
         try:
-            profile_df = pd.read_csv(fname)
-            break
-        except Exception:
-            profile_df = pd.DataFrame()
+            snap = load_snapshot(curated_dishes())
+        finally:
+            data_status['reloading'] = False
+        if snap.errors and not first:
+            data_status['reload_errors'] = snap.errors
+            return False
+        data = snap
+        data_status.update(state='failed' if snap.errors else 'ready', errors=snap.errors, warnings=snap.warnings,
+                           seconds=snap.seconds, loaded_at=snap.loaded_at, reload_errors=[])
+        _data_ready.set()
+        return not snap.errors
+    finally:
+        _reload_lock.release()
 
-# Generic auto-discovery: pick any CSV with required suggestion columns
-if profile_df.empty:
-    required_cols = {
-        'Dietary Preference', 'Breakfast Suggestion', 'Lunch Suggestion', 'Dinner Suggestion'
+# BMI bands: upper bound, category and recommended daily calories / vitamin A / B1 / C
+bmi_bands = [
+    (18.5, 'Underweight', 2500, 900, 1.2, 90),
+    (25, 'Normal', 2000, 800, 1.1, 75),
+    (30, 'Overweight', 1800, 700, 1.0, 65),
+    (np.inf, 'Obese', 1600, 600, 0.9, 60),
+]
+
+def bmi_targets(weight, height):
+    """BMI, category and recommended nutrients for arrays of weights (kg) and heights (cm)"""
+    weight = np.asarray(weight, dtype=float)
+    height = np.asarray(height, dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        bmi = np.where(height > 0, weight / (height / 100) ** 2, 0.0)
+    upper, cat, cal, vit_a, vit_b, vit_c = (np.array(col) for col in zip(*bmi_bands))
+    band = np.minimum(np.searchsorted(upper[:-1], bmi, side='right'), len(upper) - 1)
+    return {
+        'bmi': bmi.tolist(),
+        'bmi_cat': cat[band].tolist(),
+        'rec_cal': cal[band].tolist(),
+        'rec_a': vit_a[band].tolist(),
+        'rec_b': vit_b[band].tolist(),
+        'rec_c': vit_c[band].tolist(),
     }
-    for path in glob.glob("*.csv"):
-        try:
-            tmp = pd.read_csv(path)
-            if required_cols.issubset(set(tmp.columns)):
-                profile_df = tmp
-                break
-        except Exception:
-            continue
 
 # Disease to diet mapping
 disease_map = {
@@ -70,74 +133,180 @@ disease_map = {
     'Obesity': 'Low_Carb'
 }
 
-# Indian cuisine API integration
-def get_indian_meal_suggestions(diet_pref, health_condition, calories=2000, meal_type='main course'):
-    """Get Indian meal suggestions from Spoonacular API or fallback to local Indian foods"""
-    suggestions = []
-    
-    # Try Spoonacular API first (requires API key)
-    spoonacular_key = os.getenv('SPOONACULAR_API_KEY')  # Set this in environment
-    if spoonacular_key:
+def predict_diets(snap, rows, diseases):
+    """Diet types of many profiles from one predict call; disease_map when there is no model"""
+    if snap.diet_model is not None and rows:
         try:
-            url = "https://api.spoonacular.com/recipes/complexSearch"
-            params = {
-                'apiKey': spoonacular_key,
-                'cuisine': 'indian',
-                'diet': 'vegetarian' if diet_pref.lower() in ['veg', 'vegetarian'] else None,
-                'maxCalories': calories,
-                'number': 10,
-                'addRecipeInformation': True
-            }
-            if diet_pref.lower() == 'vegan':
-                params['diet'] = 'vegan'
-            
-            response = requests.get(url, params=params, timeout=5)
-            if response.status_code == 200:
-                data = response.json()
-                for recipe in data.get('results', [])[:5]:
-                    suggestions.append(recipe.get('title', 'Indian Recipe'))
+            return snap.diet_model.predict(rows)
         except Exception:
-            pass  # Fallback to local suggestions
-    
+            pass
+    return [disease_map.get(d, 'Balanced') for d in diseases]
+
+async def predict_diet(snap, row, disease):
+    """Diet type of one profile, micro-batched with concurrent requests; disease_map when
+    the model is missing, saturated or slower than its timeout"""
+    diet = None
+    if snap.diet_batcher is not None:
+        with metrics.stage('diet_model'):
+            diet = await snap.diet_batcher.predict(row)
+    return diet or disease_map.get(disease, 'Balanced')
+
+# Curated Indian meal suggestions, used whenever the API has nothing to offer
+indian_meals = {
+    'vegetarian': {
+        'breakfast': ['Poha with vegetables', 'Upma with sambar', 'Idli with coconut chutney', 
+                     'Dosa with potato curry', 'Paratha with curd', 'Aloo paratha with pickle'],
+        'lunch': ['Dal rice with vegetable curry', 'Rajma with roti', 'Chole with bhature', 
+                 'Sambar rice with papad', 'Biryani with raita', 'Paneer curry with naan'],
+        'dinner': ['Khichdi with ghee', 'Dal tadka with roti', 'Vegetable curry with rice', 
+                  'Paneer butter masala with naan', 'Mixed dal with chapati', 'Aloo gobi with roti']
+    },
+    'vegan': {
+        'breakfast': ['Poha with peanuts', 'Upma with vegetables', 'Idli with sambar', 
+                     'Dosa with chutney', 'Ragi porridge', 'Oats upma'],
+        'lunch': ['Dal rice with pickle', 'Rajma with roti', 'Chana masala with rice', 
+                 'Sambar rice', 'Vegetable biryani', 'Mixed vegetable curry with roti'],
+        'dinner': ['Khichdi with turmeric', 'Dal with chapati', 'Vegetable curry with rice', 
+                  'Aloo curry with roti', 'Mixed dal with bread', 'Sabzi with roti']
+    },
+    'omnivore': {
+        'breakfast': ['Egg curry with paratha', 'Chicken sandwich', 'Omelette with bread', 
+                     'Boiled eggs with upma', 'Egg bhurji with roti', 'Masala omelette'],
+        'lunch': ['Chicken curry with rice', 'Mutton biryani', 'Fish curry with roti', 
+                 'Egg curry with dal rice', 'Chicken biryani', 'Keema with naan'],
+        'dinner': ['Dal chicken with rice', 'Fish fry with roti', 'Chicken curry with chapati', 
+                  'Egg curry with bread', 'Mutton curry with rice', 'Chicken masala with naan']
+    }
+}
+
+# Suggested when neither Spoonacular nor the curated lists have anything
+DEFAULT_MEALS = ['Mixed dal with rice', 'Vegetable curry with roti']
+
+def curated_dishes():
+    """Every dish get_indian_meal_suggestions can offer without Spoonacular"""
+    return [dish for meals in indian_meals.values() for dishes in meals.values() for dish in dishes] + DEFAULT_MEALS
+
+if not LAZY_STARTUP:
+    load_data()
+
+# Bounded pool that builds /plan's days off the event loop (PLAN_BACKEND,
+# PLAN_WORKERS, PLAN_QUEUE, PLAN_TIMEOUT); process workers load their own snapshot
+plan_pool = PlanPool(load=functools.partial(load_snapshot, tuple(curated_dishes())))
+
+# Shared async Spoonacular client (connection pool, response cache, circuit breaker)
+spoonacular = SpoonacularClient()
+
+# Progress log shared by all workers; writes from concurrent requests are group-committed
+try:
+    progress_store = ProgressStore()
+    progress_writer = BatchWriter(progress_store)
+except Exception:
+    progress_store = progress_writer = None
+
+# Indian cuisine API integration
+async def get_indian_meal_suggestions(diet_pref, health_condition, calories=2000, meal_type='main course', allergies=None):
+    """Get Indian meal suggestions from Spoonacular API or fallback to local Indian foods"""
+    pref_key = 'vegetarian' if diet_pref.lower() in ['veg', 'vegetarian'] else \
+              'vegan' if diet_pref.lower() == 'vegan' else 'omnivore'
+
+    # Try Spoonacular API first (requires SPOONACULAR_API_KEY in the environment)
+    suggestions = await spoonacular.search(pref_key, meal_type, calories)
+    if allergies:
+        suggestions = [s for s in suggestions if not mentions(s, allergies)]
+
     # Fallback to curated Indian meal suggestions
     if not suggestions:
-        indian_meals = {
-            'vegetarian': {
-                'breakfast': ['Poha with vegetables', 'Upma with sambar', 'Idli with coconut chutney', 
-                             'Dosa with potato curry', 'Paratha with curd', 'Aloo paratha with pickle'],
-                'lunch': ['Dal rice with vegetable curry', 'Rajma with roti', 'Chole with bhature', 
-                         'Sambar rice with papad', 'Biryani with raita', 'Paneer curry with naan'],
-                'dinner': ['Khichdi with ghee', 'Dal tadka with roti', 'Vegetable curry with rice', 
-                          'Paneer butter masala with naan', 'Mixed dal with chapati', 'Aloo gobi with roti']
-            },
-            'vegan': {
-                'breakfast': ['Poha with peanuts', 'Upma with vegetables', 'Idli with sambar', 
-                             'Dosa with chutney', 'Ragi porridge', 'Oats upma'],
-                'lunch': ['Dal rice with pickle', 'Rajma with roti', 'Chana masala with rice', 
-                         'Sambar rice', 'Vegetable biryani', 'Mixed vegetable curry with roti'],
-                'dinner': ['Khichdi with turmeric', 'Dal with chapati', 'Vegetable curry with rice', 
-                          'Aloo curry with roti', 'Mixed dal with bread', 'Sabzi with roti']
-            },
-            'omnivore': {
-                'breakfast': ['Egg curry with paratha', 'Chicken sandwich', 'Omelette with bread', 
-                             'Boiled eggs with upma', 'Egg bhurji with roti', 'Masala omelette'],
-                'lunch': ['Chicken curry with rice', 'Mutton biryani', 'Fish curry with roti', 
-                         'Egg curry with dal rice', 'Chicken biryani', 'Keema with naan'],
-                'dinner': ['Dal chicken with rice', 'Fish fry with roti', 'Chicken curry with chapati', 
-                          'Egg curry with bread', 'Mutton curry with rice', 'Chicken masala with naan']
-            }
-        }
-        
-        pref_key = 'vegetarian' if diet_pref.lower() in ['veg', 'vegetarian'] else \
-                  'vegan' if diet_pref.lower() == 'vegan' else 'omnivore'
-        
         meal_category = 'lunch'  # default
         if meal_type.lower() in ['breakfast', 'lunch', 'dinner']:
             meal_category = meal_type.lower()
-            
+
         suggestions = indian_meals.get(pref_key, {}).get(meal_category, [])
-    
-    return suggestions[:5] if suggestions else ['Mixed dal with rice', 'Vegetable curry with roti']
+        if allergies:
+            suggestions = [s for s in suggestions if not mentions(s, allergies)]
+
+    return suggestions[:5] if suggestions else list(DEFAULT_MEALS)
+
+def start_watcher():
+    """Poll the source files for changes every DATA_WATCH_INTERVAL seconds (0: off)"""
+    global _watcher
+    if DATA_WATCH_INTERVAL > 0 and _watcher is None:
+        from snapshot import SourceWatcher
+        _watcher = SourceWatcher(lambda: data, load_data, DATA_WATCH_INTERVAL)
+        _watcher.start()
+
+@app.on_event('startup')
+async def warm_up():
+    """Start loading the data in the background when LAZY_STARTUP is set, and the source watcher"""
+    global _ready_event
+    _ready_event = asyncio.Event()
+    if _data_ready.is_set():
+        start_watcher()
+        _ready_event.set()
+        return
+    loop = asyncio.get_running_loop()
+
+    def run():
+        load_data()
+        start_watcher()
+        loop.call_soon_threadsafe(_ready_event.set)
+
+    threading.Thread(target=run, name='warm-up', daemon=True).start()
+
+@app.on_event('shutdown')
+async def close_spoonacular():
+    global _watcher
+    await spoonacular.aclose()
+    if _watcher is not None:
+        _watcher.stop()
+        _watcher = None
+    plan_pool.shutdown()
+
+async def wait_for_data():
+    """Wait (bounded in time and number of waiters) until warm-up has finished"""
+    global _ready_waiters
+    if _data_ready.is_set():
+        return
+    if _ready_event is None or _ready_waiters >= READY_MAX_WAITERS:
+        raise HTTPException(status_code=503, detail="Warming up, retry shortly", headers={'Retry-After': '5'})
+    _ready_waiters += 1
+    try:
+        await asyncio.wait_for(_ready_event.wait(), READY_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=503, detail="Warming up, retry shortly", headers={'Retry-After': '5'})
+    finally:
+        _ready_waiters -= 1
+
+@app.get('/healthz')
+async def healthz():
+    """Liveness: the process is up and serving"""
+    return {'status': 'ok'}
+
+@app.get('/readyz')
+async def readyz():
+    """Readiness: datasets loaded and validated (503 while warming up or after a failed load)"""
+    snap = data
+    datasets = {snap.diet_path: len(snap.diet_df), snap.profile_path or 'profiles': len(snap.profile_df)} if snap else {}
+    body = {**data_status, 'datasets': datasets,
+            'diet_model': snap.diet_model.meta if snap and snap.diet_model is not None else None,
+            'plan_pool': plan_pool.stats()}
+    return JSONResponse(body, status_code=200 if data_status['state'] == 'ready' else 503)
+
+@app.post('/admin/reload')
+async def admin_reload(request: Request):
+    """Rebuild the datasets and indexes in the background and swap them in.
+
+    Requests already running finish on the previous snapshot. A reload that
+    fails validation leaves the previous snapshot in place (500).
+    """
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Set ADMIN_TOKEN to enable reloads")
+    # Constant-time comparison, so response times do not reveal the token
+    if not hmac.compare_digest(request.headers.get('X-Admin-Token', '').encode(), ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+    ok = await asyncio.to_thread(load_data, False)
+    if ok is None:
+        raise HTTPException(status_code=409, detail="A reload is already running")
+    return JSONResponse({'reloaded': ok, **data_status}, status_code=200 if ok else 500)
 
 @app.get('/', response_class=HTMLResponse)
 async def form(request: Request):
@@ -171,39 +340,64 @@ async def recipes(request: Request):
     return templates.TemplateResponse("recipes.html", {"request": request, "recipes": recipe_list})
 
 @app.get('/progress', response_class=HTMLResponse)
-async def progress(request: Request):
-    # Simple progress page without complex tracking
-    return templates.TemplateResponse("progress.html", {"request": request})
+async def progress(request: Request, user: str = ''):
+    # Trends come from the precomputed weekly/monthly rows, not the full history
+    context = {"request": request, "user": user, "weekly": [], "monthly": []}
+    if user and progress_store is not None:
+        context['weekly'] = await asyncio.to_thread(progress_store.trends, user, 'week', 12)
+        context['monthly'] = await asyncio.to_thread(progress_store.trends, user, 'month', 12)
+    return templates.TemplateResponse("progress.html", context)
+
+class ProgressEntry(BaseModel):
+    """One day of tracking for a user"""
+    day: Optional[date] = None
+    weight: Optional[float] = Field(None, gt=0)
+    adherence: Optional[float] = Field(None, ge=0, le=1)
+    meals: List[str] = []
+
+def check_progress_store():
+    if progress_store is None:
+        raise HTTPException(status_code=503, detail="Progress store is not available")
+
+@app.post('/progress/{user}/entries')
+async def add_progress(user: str, entries: List[ProgressEntry]):
+    """Record weights, adherence and meals eaten; accepts several days at once"""
+    check_progress_store()
+    rows = [row for entry in entries for row in to_rows(user, entry.model_dump())]
+    return {'user': user, 'recorded': await progress_writer.write(rows)}
+
+@app.get('/progress/{user}/history')
+async def progress_history(user: str, start: Optional[date] = None, end: Optional[date] = None,
+                           kind: Optional[str] = None):
+    """Entries between two days (inclusive)"""
+    check_progress_store()
+    entries = await asyncio.to_thread(progress_store.history, user, start and start.isoformat(),
+                                      end and end.isoformat(), kind)
+    return {'user': user, 'entries': entries}
+
+@app.get('/progress/{user}/trends')
+async def progress_trends(user: str, period: str = 'week', limit: int = 12):
+    """Weekly or monthly averages of weight and adherence and count of meals eaten"""
+    check_progress_store()
+    if period not in PERIODS:
+        raise HTTPException(status_code=400, detail=f"period must be one of: {', '.join(PERIODS)}")
+    trends = await asyncio.to_thread(progress_store.trends, user, period, max(1, min(limit, 120)))
+    return {'user': user, 'period': period, 'trends': trends}
 
 @app.get('/shopping', response_class=HTMLResponse)
 async def shopping(request: Request):
     return templates.TemplateResponse("shopping.html", {"request": request})
 
-@app.post('/plan', response_class=HTMLResponse)
-async def plan(request: Request,
-               name: str = Form(...),
-               age: int = Form(...),
-               gender: str = Form(...),
-               weight: float = Form(...),
-               height: float = Form(...),
-               disease: str = Form(...),
-               activity_level: str = Form('Moderately Active'),
-               allergies: str = Form('None'),
-               plan_type: str = Form('Weekly'),
-               diet_pref: str = Form('Non-Veg')):
-    # Process inputs
-    bmi = weight / ((height/100)**2) if height > 0 else 0
-    # Recommend nutrients based on BMI
-    if bmi < 18.5:
-        bmi_cat = 'Underweight'; rec_cal = 2500; rec_a = 900; rec_b = 1.2; rec_c = 90
-    elif bmi < 25:
-        bmi_cat = 'Normal'; rec_cal = 2000; rec_a = 800; rec_b = 1.1; rec_c = 75
-    elif bmi < 30:
-        bmi_cat = 'Overweight'; rec_cal = 1800; rec_a = 700; rec_b = 1.0; rec_c = 65
-    else:
-        bmi_cat = 'Obese'; rec_cal = 1600; rec_a = 600; rec_b = 0.9; rec_c = 60
+async def require_diet_db():
+    """Wait for warm-up, check the nutrition database and return the snapshot to serve from"""
+    await wait_for_data()
+    snap = data
+    check_diet_db(snap)
+    return snap
 
-    # Ensure diet data is loaded and has required columns
+def check_diet_db(snap=None):
+    """Raise a 500 when the nutrition database is missing or malformed"""
+    diet_df = (snap or data).diet_df
     if diet_df.empty:
         # Nutrition database not loaded
         raise HTTPException(status_code=500, detail="Nutrition database (INDB.csv) is not loaded. Please add 'INDB.csv' to the project folder.")
@@ -211,22 +405,12 @@ async def plan(request: Request,
         # Provide debug info about available columns
         available = ', '.join(diet_df.columns.tolist())
         raise HTTPException(status_code=500, detail=f"Missing 'food_name' column. Available columns: {available}")
-    # Determine diet type
-    diet_type = disease_map.get(disease, 'Balanced')
+
+async def meal_options(snap, age, gender, disease, activity_level, diet_pref, rec_cal, allergy_list, days=7):
+    """Dishes each meal rotates through, and whether the plan has a snack"""
     # First, try to use profile suggestions dataset if available
-    plan = []
-    used_profile = False
-    show_snack = False
-    if not profile_df.empty and all(
-        col in profile_df.columns for col in [
-            'Dietary Preference', 'Breakfast Suggestion', 'Lunch Suggestion', 'Dinner Suggestion'
-        ]
-    ):
-        dfp = profile_df.copy()
-        # Normalize columns for matching
-        for c in dfp.columns:
-            if dfp[c].dtype == object:
-                dfp[c] = dfp[c].astype(str)
+    profile_index = snap.profile_index
+    if profile_index is not None:
         # Filter by dietary preference (map Non-Veg -> Omnivore)
         pref_in = (diet_pref or 'Non-Veg').strip().lower()
         if pref_in in ['non-veg', 'non veg']:
@@ -237,122 +421,520 @@ async def plan(request: Request,
             pref_key = 'vegan'
         else:
             pref_key = 'omnivore'  # default fallback
-        
-        # Debug: Check what we're filtering for
-        print(f"Looking for dietary preference: {pref_key} (from user input: {pref_in})")
-        print(f"Available preferences in dataset: {dfp['Dietary Preference'].unique()}")
-        
-        dfp = dfp[dfp['Dietary Preference'].str.lower() == pref_key]
-        # Optional filters if columns exist
-        if 'Gender' in dfp.columns:
-            dfp = dfp[(dfp['Gender'].str.lower() == gender.lower()) | (~dfp['Gender'].notna())]
-        if 'Disease' in dfp.columns and disease and disease != 'None':
-            dfp = dfp[dfp['Disease'].str.contains(re.escape(disease), case=False, na=False)]
-        if 'Activity Level' in dfp.columns and activity_level:
-            dfp = dfp[dfp['Activity Level'].str.lower() == activity_level.lower()]
-        # Pick best matches by nearest age if Ages/Age present
-        if 'Ages' in dfp.columns:
-            try:
-                dfp['_age_diff'] = (pd.to_numeric(dfp['Ages'], errors='coerce') - age).abs()
-            except Exception:
-                dfp['_age_diff'] = np.inf
-        elif 'Age' in dfp.columns:
-            try:
-                dfp['_age_diff'] = (pd.to_numeric(dfp['Age'], errors='coerce') - age).abs()
-            except Exception:
-                dfp['_age_diff'] = np.inf
-        else:
-            dfp['_age_diff'] = 0
-
-        if not dfp.empty:
-            # Build a week by sampling rows (with replacement if needed)
-            days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-            meals = ['Breakfast', 'Lunch', 'Dinner']
-            # Prefer closest age matches first
-            dfp_sorted = dfp.sort_values('_age_diff')
-            rows = dfp_sorted.head(14)  # a buffer to vary meals across week
-            # Cycle through these to fill 7 days
-            idx = 0
-            for d in days:
-                r = rows.iloc[idx % len(rows)]
-                entry = {
-                    'day': d,
-                    'Breakfast': r.get('Breakfast Suggestion', 'N/A'),
-                    'Lunch': r.get('Lunch Suggestion', 'N/A'),
-                    'Dinner': r.get('Dinner Suggestion', 'N/A'),
-                }
-                if 'Snack Suggestion' in rows.columns:
-                    entry['Snack'] = r.get('Snack Suggestion', 'N/A')
-                plan.append(entry)
-                idx += 1
-            used_profile = True
-            show_snack = 'Snack Suggestion' in rows.columns
-
-    # If profile suggestions not used, use Indian cuisine API or curated Indian meals
-    if not used_profile:
-        # Generate Indian meal plan using API or local suggestions
-        days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
-        plan = []
-        grocery = []
-        
-        # Map dietary preference for Indian cuisine - ensure strict filtering
-        pref_in = (diet_pref or 'Non-Veg').strip().lower()
-        if pref_in in ['veg', 'vegetarian']:
-            pref_key = 'vegetarian'
-        elif pref_in == 'vegan':
-            pref_key = 'vegan'
-        else:
-            pref_key = 'omnivore'
-        
-        print(f"Using Indian cuisine preference: {pref_key} for user selection: {pref_in}")
-        
-        for day in days:
-            entry = {'day': day}
-            # Get suggestions for each meal type
-            breakfast_options = get_indian_meal_suggestions(diet_pref, disease, rec_cal//3, 'breakfast')
-            lunch_options = get_indian_meal_suggestions(diet_pref, disease, rec_cal//2, 'lunch')  
-            dinner_options = get_indian_meal_suggestions(diet_pref, disease, rec_cal//3, 'dinner')
-            
-            entry['Breakfast'] = random.choice(breakfast_options) if breakfast_options else 'Indian breakfast'
-            entry['Lunch'] = random.choice(lunch_options) if lunch_options else 'Indian lunch'
-            entry['Dinner'] = random.choice(dinner_options) if dinner_options else 'Indian dinner'
-            
-            plan.append(entry)
-            
-        # Generate nutrition summary instead of grocery list
+
+        # Closest age matches within the (preference, gender, activity, disease)
+        # bucket; plans longer than a week draw on more of them for variety.
+        # Suggestions naming an allergen or a food the diet preference rules out are skipped
+        with metrics.stage('profile_lookup'):
+            excluded = exclusions(diet_pref, allergy_list)
+            exclude = snap.profile_allergens.mask(excluded) if excluded else None
+            rows = profile_index.lookup(pref_key, gender, activity_level, disease, age,
+                                        k=14 if days <= 7 else 42, exclude=exclude)
+
+        if rows:
+            meals = ['Breakfast', 'Lunch', 'Dinner'] + (['Snack'] if profile_index.has_snack else [])
+            return {meal: [r.get(f'{meal} Suggestion', 'N/A') for r in rows] for meal in meals}, profile_index.has_snack
+
+    # If profile suggestions not used, use Indian cuisine API or curated Indian meals;
+    # suggestions are fetched once per meal type, they are the same for every day
+    with metrics.stage('suggestions'):
+        breakfast_options, lunch_options, dinner_options = await asyncio.gather(
+            get_indian_meal_suggestions(diet_pref, disease, rec_cal//3, 'breakfast', allergy_list),
+            get_indian_meal_suggestions(diet_pref, disease, rec_cal//2, 'lunch', allergy_list),
+            get_indian_meal_suggestions(diet_pref, disease, rec_cal//3, 'dinner', allergy_list),
+        )
+    return {
+        'Breakfast': breakfast_options or ['Indian breakfast'],
+        'Lunch': lunch_options or ['Indian lunch'],
+        'Dinner': dinner_options or ['Indian dinner'],
+    }, False
+
+async def build_plan(name, age, gender, weight, height, disease, activity_level='Moderately Active',
+                     allergies='None', plan_type='Weekly', diet_pref='Non-Veg', targets=None, snap=None,
+                     window=NO_REPEAT_DAYS, seed=None, severity=None, glucose=None, cholesterol=None,
+                     blood_pressure=None, diet_type=None, wait=False, slot=None):
+    """Everything /plan renders for one profile; targets may hold a precomputed bmi_targets row.
+
+    The plan covers plan_type's days ('Weekly', 'Monthly', '90', ...). snap is
+    the data snapshot to plan from (the current one by default). A seed makes
+    the dishes and servings repeatable; without one they vary per request. The
+    clinical measurements are optional inputs of the diet classifier; diet_type
+    skips it.
+    The days are built on plan_pool (in slot, when the caller reserved one),
+    which raises PoolSaturated when it is full (unless wait), PlanTimeout
+    when the plan takes too long and StaleSnapshot when a process worker
+    cannot load snap's data.
+    """
+    snap = snap or data
+    # Recommend nutrients based on BMI
+    if targets is None:
+        targets = {k: v[0] for k, v in bmi_targets([weight], [height]).items()}
+    bmi = targets['bmi']
+    rec_cal = targets['rec_cal']
+
+    # Determine diet type: the classifier when available, else by disease
+    if diet_type is None:
+        diet_type = await predict_diet(snap, profile_features(
+            age, gender, bmi, disease, activity_level, severity, glucose, cholesterol, blood_pressure), disease)
+    allergy_list = parse_allergies(allergies)
+    days = plan_length(plan_type)
+    options, show_snack = await meal_options(snap, age, gender, disease, activity_level, diet_pref,
+                                             rec_cal, allergy_list, days)
+
+    plan, nutrient_plan, meal_nutrition, shopping_list = await plan_pool.run(
+        compose_plan, snap, options, days, rec_cal, diet_type, exclusions(diet_pref, allergy_list), window, seed,
+        wait=wait, slot=slot)
+
+    with metrics.stage('nutrition_summary'):
         nutrition_summary = {
             'total_meals': len(plan) * 3,
             'dietary_preference': diet_pref,
             'health_focus': diet_type,
             'weekly_variety': len(set([row['Breakfast'] for row in plan] + [row['Lunch'] for row in plan] + [row['Dinner'] for row in plan]))
         }
-    else:
-        # Grocery list derived from unique dishes in the plan (profile-based)
-        items = [row['Breakfast'] for row in plan] + [row['Lunch'] for row in plan] + [row['Dinner'] for row in plan]
-        if show_snack:
-            items += [row.get('Snack') for row in plan]
-        grocery = list(dict.fromkeys([x for x in items if x and x != 'N/A']))
-
-    return templates.TemplateResponse('result.html', {
-        'request': request,
+
+    return {
         'name': name,
         'age': age,
         'gender': gender,
         'bmi': f"{bmi:.1f}",
-        'bmi_cat': bmi_cat,
+        'bmi_cat': targets['bmi_cat'],
         'rec_cal': rec_cal,
-        'rec_a': rec_a,
-        'rec_b': rec_b,
-        'rec_c': rec_c,
+        'rec_a': targets['rec_a'],
+        'rec_b': targets['rec_b'],
+        'rec_c': targets['rec_c'],
         'diet_type': diet_type,
         'plan': plan,
-        'nutrition_summary': nutrition_summary if not used_profile else {
-            'total_meals': len(plan) * 3,
-            'dietary_preference': diet_pref,
-            'health_focus': diet_type,
-            'weekly_variety': len(set([row['Breakfast'] for row in plan] + [row['Lunch'] for row in plan] + [row['Dinner'] for row in plan]))
-        },
+        'nutrition_summary': nutrition_summary,
         'plan_type': plan_type,
         'diet_pref': diet_pref,
-        'show_snack': show_snack
-    })
+        'show_snack': show_snack,
+        'nutrient_plan': nutrient_plan,
+        'meal_nutrition': meal_nutrition,
+        'shopping_list': shopping_list
+    }
+
+# Send "X-Plan-Profile: 1" with /plan to get its stage timings back in a Server-Timing header
+PROFILE_HEADER = 'X-Plan-Profile'
+
+@app.post('/plan', response_class=HTMLResponse)
+async def plan(request: Request,
+               name: str = Form(...),
+               age: int = Form(...),
+               gender: str = Form(...),
+               weight: float = Form(...),
+               height: float = Form(...),
+               disease: str = Form(...),
+               activity_level: str = Form('Moderately Active'),
+               allergies: str = Form('None'),
+               plan_type: str = Form('Weekly'),
+               diet_pref: str = Form('Non-Veg'),
+               severity: Optional[str] = Form(None),
+               glucose: Optional[float] = Form(None),
+               cholesterol: Optional[float] = Form(None),
+               blood_pressure: Optional[float] = Form(None),
+               seed: Optional[int] = Form(None)):
+    # Ensure diet data is loaded and has required columns
+    snap = await require_diet_db()
+    profile = request.headers.get(PROFILE_HEADER) == '1'
+    timings = metrics.start_request(profile)
+    with metrics.stage('total'):
+        try:
+            # Take the pool slot first: a full pool answers 503 before the diet model runs
+            async with plan_pool.reserve() as slot:
+                context = await build_plan(name, age, gender, weight, height, disease,
+                                           activity_level, allergies, plan_type, diet_pref, snap=snap,
+                                           severity=severity, glucose=glucose, cholesterol=cholesterol,
+                                           blood_pressure=blood_pressure, seed=seed, slot=slot)
+        except PoolSaturated:
+            raise HTTPException(status_code=503, detail="Too many plans in progress, retry shortly",
+                                headers={'Retry-After': PLAN_RETRY_AFTER})
+        except StaleSnapshot:
+            raise HTTPException(status_code=503, detail="Nutrition data is being reloaded, retry shortly",
+                                headers={'Retry-After': PLAN_RETRY_AFTER})
+        except PlanTimeout:
+            raise HTTPException(status_code=504, detail="Plan construction timed out")
+        with metrics.stage('render'):
+            response = templates.TemplateResponse('result.html', {'request': request, **context})
+    if profile:
+        response.headers['Server-Timing'] = metrics.server_timing(timings)
+    return response
+
+@app.get('/metrics')
+async def metrics_endpoint():
+    """Stage latency histograms in the Prometheus text format"""
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
+
+class PlanProfile(BaseModel):
+    """One profile of a /plan/batch request; fields and defaults mirror the /plan form"""
+    name: str = ''
+    age: int
+    gender: str
+    weight: float
+    height: float
+    disease: str = 'None'
+    activity_level: str = 'Moderately Active'
+    allergies: str = 'None'
+    plan_type: str = 'Weekly'
+    diet_pref: str = 'Non-Veg'
+    severity: Optional[str] = None
+    glucose: Optional[float] = None
+    cholesterol: Optional[float] = None
+    blood_pressure: Optional[float] = None
+    seed: Optional[int] = None
+
+    def features(self, bmi):
+        """Diet classifier input for this profile"""
+        return profile_features(self.age, self.gender, bmi, self.disease, self.activity_level,
+                                self.severity, self.glucose, self.cholesterol, self.blood_pressure)
+
+# Profiles validated and given BMI targets together before their plans are streamed
+BATCH_CHUNK = 256
+
+async def _spool_body(request):
+    """Copy the request body to a spooled temp file (on disk past 1 MB) and rewind it"""
+    spool = tempfile.SpooledTemporaryFile(max_size=1 << 20)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+    return spool
+
+def _ndjson_lines(spool):
+    """Non-empty lines of a spooled NDJSON body; closes the spool when exhausted"""
+    with spool:
+        for line in spool:
+            if line.strip():
+                yield line
+
+class _JsonStream:
+    """JSON values read one at a time from a file, a block at a time"""
+
+    def __init__(self, fh, block=1 << 16):
+        # The incremental reader keeps multi-byte characters split across blocks intact
+        self.fh = codecs.getreader('utf-8')(fh)
+        self.block = block
+        self.buf = ''
+        self.pos = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def _more(self):
+        text = self.fh.read(self.block)
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        self.eof = not text
+        return not self.eof
+
+    def peek(self):
+        """Next non-whitespace character ('' at the end)"""
+        while True:
+            while self.pos < len(self.buf) and self.buf[self.pos] in ' \t\r\n':
+                self.pos += 1
+            if self.pos < len(self.buf) or not self._more():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Expected one of {chars!r}", self.buf, self.pos)
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Next complete value; only as much of the file as it spans is held"""
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                if not self._more():
+                    raise
+                continue
+            # A number cut off by the end of the block goes on in the next one
+            if self.eof or not isinstance(value, (int, float)) or \
+                    (end < len(self.buf) and self.buf[end] not in '0123456789.eE+-'):
+                self.pos = end
+                return value
+            self._more()
+
+def _json_profiles(fh):
+    """Items of a JSON body ([...] or {"profiles": [...]}), decoded one by one.
+
+    Raises json.JSONDecodeError on malformed JSON and ValueError when there
+    is no list of profiles.
+    """
+    stream = _JsonStream(fh)
+    if not stream.peek():
+        raise json.JSONDecodeError("Expecting value", stream.buf, stream.pos)
+    wrapped = stream.peek() == '{'
+    if wrapped:
+        stream.expect('{')
+        while True:
+            if stream.peek() == '}':
+                raise ValueError("no profiles")
+            key = stream.value()
+            stream.expect(':')
+            if key == 'profiles':
+                break
+            stream.value()
+            if stream.expect(',}') == '}':
+                raise ValueError("no profiles")
+    if stream.peek() != '[':
+        raise ValueError("profiles is not a list")
+    stream.expect('[')
+    if stream.peek() == ']':
+        stream.expect(']')
+    else:
+        while True:
+            yield stream.value()
+            if stream.expect(',]') == ']':
+                break
+    if wrapped:
+        while stream.expect(',}') == ',':
+            stream.value()
+            stream.expect(':')
+            stream.value()
+    if stream.peek():
+        raise json.JSONDecodeError("Extra data", stream.buf, stream.pos)
+
+def _json_items(spool):
+    """Profiles of a spooled JSON body; closes the spool when exhausted"""
+    with spool:
+        yield from _json_profiles(spool)
+
+def _take(items, n):
+    """The next n items of an iterator (fewer at its end), and the decode error that cut them short"""
+    chunk = []
+    try:
+        for item in itertools.islice(items, n):
+            chunk.append(item)
+    except (json.JSONDecodeError, UnicodeDecodeError) as exc:
+        return chunk, exc
+    return chunk, None
+
+async def _offload(items, first=None):
+    """Items of a blocking iterator over a spooled body, read BATCH_CHUNK at a
+    time in a worker thread so the event loop never decodes the body; a decode
+    error is raised after the items before it"""
+    chunk, error = first or await asyncio.to_thread(_take, items, BATCH_CHUNK)
+    while True:
+        for item in chunk:
+            yield item
+        if error is not None:
+            raise error
+        if not chunk:
+            return
+        chunk, error = await asyncio.to_thread(_take, items, BATCH_CHUNK)
+
+async def _batch_plans(items, snap):
+    """NDJSON lines, one per profile, produced chunk by chunk from one data snapshot"""
+    index = 0
+    chunk = []
+
+    async def flush():
+        valid = [(i, p) for i, p in chunk if isinstance(p, PlanProfile)]
+        targets = bmi_targets([p.weight for _, p in valid], [p.height for _, p in valid])
+        # Diet types for the whole chunk in one predict call
+        diets = await asyncio.to_thread(predict_diets, snap, [p.features(bmi) for (_, p), bmi in zip(valid, targets['bmi'])],
+                                        [p.disease for _, p in valid])
+        rows = iter(range(len(valid)))
+        for i, p in chunk:
+            if not isinstance(p, PlanProfile):
+                yield json.dumps({'index': i, 'error': p}) + '\n'
+                continue
+            row = next(rows)
+            # The stream has started, so wait for a worker instead of answering 503
+            try:
+                context = await build_plan(**p.model_dump(), targets={k: v[row] for k, v in targets.items()},
+                                           snap=snap, diet_type=diets[row], wait=True)
+            except PlanTimeout:
+                yield json.dumps({'index': i, 'error': 'Plan construction timed out'}) + '\n'
+                continue
+            except StaleSnapshot:
+                yield json.dumps({'index': i, 'error': 'Nutrition data is being reloaded, retry shortly'}) + '\n'
+                continue
+            yield json.dumps({'index': i, **context}) + '\n'
+
+    malformed = False
+    try:
+        async for item in items:
+            try:
+                if isinstance(item, (bytes, str)):
+                    profile = PlanProfile.model_validate_json(item)
+                else:
+                    profile = PlanProfile.model_validate(item)
+            except ValidationError as exc:
+                profile = exc.errors(include_url=False, include_context=False, include_input=False)
+            chunk.append((index, profile))
+            index += 1
+            if len(chunk) >= BATCH_CHUNK:
+                async for line in flush():
+                    yield line
+                chunk = []
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        # A JSON body that breaks off after its first chunk: the plans before stand
+        malformed = True
+    async for line in flush():
+        yield line
+    if malformed:
+        yield json.dumps({'index': index, 'error': 'Body must be a JSON list of profiles'}) + '\n'
+
+@app.post('/plan/batch')
+async def plan_batch(request: Request):
+    """Plans for many profiles, streamed back as NDJSON lines in input order.
+
+    Accepts a JSON list of profiles ({"profiles": [...]} or [...]) or an
+    NDJSON body with one profile per line. Either way the body is spooled
+    and its profiles decoded one at a time, a chunk per worker-thread call,
+    so memory does not grow with the number of profiles and the event loop
+    does not decode. A JSON body is answered with 400 when its first chunk is
+    malformed; one that breaks off later ends the stream with an error line.
+    """
+    snap = await require_diet_db()
+    content_type = request.headers.get('content-type', '')
+    # The body must be read before the response starts streaming
+    spool = await _spool_body(request)
+    if 'ndjson' in content_type or 'jsonl' in content_type:
+        items = _offload(_ndjson_lines(spool))
+    else:
+        profiles = _json_items(spool)
+        # The first chunk is decoded before streaming starts, to answer 400 for a
+        # body that is not a list of profiles
+        try:
+            first = await asyncio.to_thread(_take, profiles, BATCH_CHUNK)
+        except ValueError:
+            spool.close()
+            raise HTTPException(status_code=400, detail="Expected a list of profiles")
+        if first[1] is not None:
+            spool.close()
+            raise HTTPException(status_code=400, detail="Body must be a JSON list of profiles or NDJSON")
+        items = _offload(profiles, first)
+    return StreamingResponse(_batch_plans(items, snap), media_type='application/x-ndjson')
+
+class LongPlan(PlanProfile):
+    """A /plan/stream request: a profile, the plan's length and its variety rule.
+
+    days overrides plan_type; no dish repeats in its meal within no_repeat_days.
+    """
+    days: Optional[int] = Field(None, ge=1, le=MAX_PLAN_DAYS)
+    no_repeat_days: int = Field(NO_REPEAT_DAYS, ge=1, le=MAX_PLAN_DAYS)
+
+async def _stream_plan(p, snap):
+    """NDJSON lines: the profile's targets, one line per day as it is produced, then the shopping list"""
+    targets = {k: v[0] for k, v in bmi_targets([p.weight], [p.height]).items()}
+    rec_cal = targets['rec_cal']
+    diet_type = await predict_diet(snap, p.features(targets['bmi']), p.disease)
+    allergy_list = parse_allergies(p.allergies)
+    days = p.days or plan_length(p.plan_type)
+    excluded = exclusions(p.diet_pref, allergy_list)
+    food_mask = snap.food_allergens.mask(excluded) if excluded and snap.plan_engine is not None else None
+    options, show_snack = await meal_options(snap, p.age, p.gender, p.disease, p.activity_level, p.diet_pref,
+                                             rec_cal, allergy_list, days)
+    yield json.dumps({
+        'name': p.name, 'age': p.age, 'gender': p.gender, 'bmi': f"{targets['bmi']:.1f}",
+        'bmi_cat': targets['bmi_cat'], 'rec_cal': rec_cal, 'rec_a': targets['rec_a'],
+        'rec_b': targets['rec_b'], 'rec_c': targets['rec_c'], 'diet_type': diet_type,
+        'diet_pref': p.diet_pref, 'days': days, 'no_repeat_days': p.no_repeat_days,
+        'meals': list(options), 'show_snack': show_snack,
+    }) + '\n'
+    # Dish tally for the shopping list: grows with the number of distinct dishes, not days
+    counts = Counter()
+    meals = list(options)
+    for start, chunk in plan_chunks(options, days, p.no_repeat_days, p.seed):
+        # Each chunk's servings and nutrition are built on plan_pool, queueing for a
+        # worker rather than failing half-way through the stream
+        try:
+            servings, nutrition = await plan_pool.run(plan_chunk, snap, chunk, meals, start, days, rec_cal,
+                                                      diet_type, food_mask, p.seed, wait=True)
+        except PlanTimeout:
+            yield json.dumps({'index': start, 'error': 'Plan construction timed out'}) + '\n'
+            return
+        except StaleSnapshot:
+            yield json.dumps({'index': start, 'error': 'Nutrition data is being reloaded, retry shortly'}) + '\n'
+            return
+        for i, row in enumerate(chunk, start):
+            counts.update(row[m] for m in meals)
+            yield json.dumps({'index': i, 'plan': row, 'nutrient_plan': servings[i - start],
+                              'meal_nutrition': nutrition[i - start]}) + '\n'
+    footer = {'variety': len(counts), 'shopping_list': None}
+    if snap.shopping is not None:
+        footer['shopping_list'] = snap.shopping.from_counts(counts)
+    yield json.dumps(footer) + '\n'
+
+@app.post('/plan/stream')
+async def plan_stream(request: LongPlan):
+    """A plan of any length (e.g. 30, 90 or 365 days) streamed as NDJSON, day by day"""
+    snap = await require_diet_db()
+    return StreamingResponse(_stream_plan(request, snap), media_type='application/x-ndjson')
+
+@app.get('/foods/search')
+async def foods_search(q: str = '', limit: int = 10, fields: str = SEARCH_FIELDS):
+    """Foods matching a name prefix, a misspelt name or a food code, best first.
+
+    fields is a comma-separated list of INDB columns to return with each match.
+    """
+    snap = await require_diet_db()
+    columns = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [c for c in columns if c not in snap.diet_df.columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    limit = max(1, min(limit, 50))
+    rows, scores = snap.food_search.search(q, limit)
+    return {'query': q, 'results': snap.food_search.records(rows, scores, columns)}
+
+@app.get('/foods/{food_code}/substitutes')
+async def food_substitutes(food_code: str, k: int = 10, diet_pref: str = '', allergies: str = '',
+                           fields: str = SEARCH_FIELDS):
+    """Foods closest in nutrients to a food, closest first.
+
+    Neighbours are precomputed per food, so this only filters them: diet_pref
+    (Veg/Vegan) and allergies (comma-separated) drop foods at query time, and
+    at most TOP_K neighbours are considered. score is 1 / (1 + distance).
+    """
+    snap = await require_diet_db()
+    if snap.substitutes is None:
+        raise HTTPException(status_code=500, detail="Nutrition database (INDB.csv) has no energy_kcal column")
+    columns = [f.strip() for f in fields.split(',') if f.strip()]
+    unknown = [c for c in columns if c not in snap.diet_df.columns]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Unknown fields: {', '.join(unknown)}")
+    row = snap.food_search.find_code(food_code)
+    if row is None:
+        raise HTTPException(status_code=404, detail=f"Unknown food code: {food_code}")
+    excluded = exclusions(diet_pref, allergies)
+    exclude = snap.food_allergens.mask(excluded) if excluded else None
+    rows, distances = snap.substitutes.lookup(row, max(1, min(k, TOP_K)), exclude)
+    results = snap.food_search.records(rows, 1.0 / (1.0 + distances), columns)
+    for record, distance in zip(results, distances):
+        record['distance'] = round(float(distance), 3)
+    return {'food': snap.food_search.records([row], [1.0], columns)[0], 'diet_pref': diet_key(diet_pref),
+            'results': results}
+
+class Household(BaseModel):
+    """Members planned together for /shopping/list"""
+    days: int = Field(7, ge=1, le=366)
+    members: List[PlanProfile] = Field(..., min_length=1, max_length=HOUSEHOLD_MAX)
+
+@app.post('/shopping/list')
+async def shopping_list(household: Household):
+    """One consolidated shopping list for every member's INDB plan over `days` days"""
+    snap = await require_diet_db()
+    if snap.shopping is None:
+        raise HTTPException(status_code=500, detail="Nutrition database (INDB.csv) has no energy_kcal column")
+    members = household.members
+    targets = bmi_targets([m.weight for m in members], [m.height for m in members])
+    diets = await asyncio.to_thread(predict_diets, snap, [m.features(bmi) for m, bmi in zip(members, targets['bmi'])],
+                                    [m.disease for m in members])
+    excluded = [exclusions(m.diet_pref, m.allergies) for m in members]
+    try:
+        result = await plan_pool.run(household_shopping, snap, list(targets['rec_cal']), list(diets), excluded,
+                                     household.days)
+    except PoolSaturated:
+        raise HTTPException(status_code=503, detail="Too many plans in progress, retry shortly",
+                            headers={'Retry-After': PLAN_RETRY_AFTER})
+    except StaleSnapshot:
+        raise HTTPException(status_code=503, detail="Nutrition data is being reloaded, retry shortly",
+                            headers={'Retry-After': PLAN_RETRY_AFTER})
+    except PlanTimeout:
+        raise HTTPException(status_code=504, detail="Plan construction timed out")
+    return {'days': household.days, 'members': len(members), **result}
@@ -0,0 +1,159 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+import httpx
+
+import metrics
+
+SPOONACULAR_URL = "https://api.spoonacular.com"
+
+
+class TTLCache:
+    """Small LRU cache whose entries also expire after ttl seconds"""
+
+    def __init__(self, maxsize=512, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def get(self, key):
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires, value = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value):
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class CircuitBreaker:
+    """Opens after max_failures consecutive errors and retries after reset_after seconds"""
+
+    def __init__(self, max_failures=3, reset_after=30):
+        self.max_failures = max_failures
+        self.reset_after = reset_after
+        self.failures = 0
+        self.opened_at = None
+
+    def allow(self):
+        if self.opened_at is None:
+            return True
+        # Half-open: let one call through once the cool-down has passed
+        if time.monotonic() - self.opened_at >= self.reset_after:
+            self.opened_at = time.monotonic()
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+
+    def failure(self):
+        self.failures += 1
+        if self.failures >= self.max_failures:
+            self.opened_at = time.monotonic()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+
+class SpoonacularClient:
+    """Async Spoonacular recipe search with pooling, caching and coalescing.
+
+    Lookups return a list of recipe titles, or an empty list when the API is
+    unavailable (no key, upstream error or open circuit) so the caller can
+    fall back to the curated meals.
+    """
+
+    def __init__(self, api_key=None, base_url=None, timeout=5.0, cache=None,
+                 breaker=None, calorie_bucket=100, max_connections=20):
+        self.api_key = api_key if api_key is not None else os.getenv('SPOONACULAR_API_KEY')
+        self.base_url = base_url or os.getenv('SPOONACULAR_BASE_URL', SPOONACULAR_URL)
+        self.timeout = timeout
+        self.cache = cache if cache is not None else TTLCache()
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+        self.calorie_bucket = calorie_bucket
+        self.max_connections = max_connections
+        self.upstream_calls = 0
+        self._client = None
+        self._inflight = {}
+
+    def _http(self):
+        # Created lazily so the pool belongs to the running event loop
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_connections,
+                                    max_keepalive_connections=self.max_connections),
+            )
+        return self._client
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def cache_key(self, diet, meal_type, calories):
+        bucket = max(int(calories) // self.calorie_bucket, 1) * self.calorie_bucket
+        return (diet, meal_type.lower(), bucket)
+
+    async def search(self, diet, meal_type, calories):
+        """Recipe titles for (diet, meal_type, calories); [] means use the fallback"""
+        if not self.api_key:
+            return []
+        key = self.cache_key(diet, meal_type, calories)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        # Identical lookups already in flight share the same upstream call
+        pending = self._inflight.get(key)
+        if pending is None:
+            pending = asyncio.ensure_future(self._fetch(key))
+            self._inflight[key] = pending
+            pending.add_done_callback(lambda _f, k=key: self._inflight.pop(k, None))
+        return await asyncio.shield(pending)
+
+    async def _fetch(self, key):
+        if not self.breaker.allow():
+            return []
+        diet, meal_type, calories = key
+        params = {
+            'apiKey': self.api_key,
+            'cuisine': 'indian',
+            'maxCalories': calories,
+            'number': 10,
+            'addRecipeInformation': True,
+        }
+        if diet in ('vegetarian', 'vegan'):
+            params['diet'] = diet
+        self.upstream_calls += 1
+        try:
+            with metrics.stage('upstream'):
+                response = await self._http().get('/recipes/complexSearch', params=params)
+                response.raise_for_status()
+            titles = [r.get('title', 'Indian Recipe') for r in response.json().get('results', [])[:5]]
+        except Exception:
+            self.breaker.failure()
+            return []
+        self.breaker.success()
+        if titles:
+            self.cache.set(key, titles)
+        return titles
@@ -0,0 +1,263 @@
+import re
+from functools import lru_cache
+
+import numpy as np
+
+from allergens import tokenize
+from plan_engine import NUTRIENTS
+
+# Words that do not have to appear in the matched INDB food name: function words
+# and the basic preparations that name the plain food ("Boiled rice" is rice)
+STOPWORDS = {'a', 'an', 'and', 'in', 'of', 'on', 'side', 'the', 'with', 'plain', 'boiled', 'steamed', 'cooked'}
+
+# A dish that matches no single INDB food is split into its parts here
+# ("Dal with chapati" -> "Dal", "chapati") and each part is matched on its own
+SEPARATORS = re.compile(r'\s+(?:with|on|over|and|plus)\s+|\s*[,&+/]\s*', re.I)
+
+# INDB names carry other names of the food: in brackets starting with a capital
+# ("Boiled rice (Uble chawal)", several split by commas or " / ") and as slashed
+# words ("Chapati/Roti", "Plain parantha/paratha"). Lower-case brackets only
+# qualify the food ("Lassi (salted)") and are left out.
+_BRACKETS = re.compile(r'\(([^)]*)\)')
+_ALIAS_SPLIT = re.compile(r'\s*,\s*|\s+/\s*|\s*/\s+')
+
+# Names that join several foods ("Potato with curd", "Paneer, apple and pineapple
+# salad") only match a dish part that names all of them
+_COMPOUND = re.compile(r'\s(?:with|on|over|and|plus)\s|[,&+]', re.I)
+
+# Search hits checked per dish part
+CANDIDATES = 50
+
+# Share of a food name's words the dish part has to account for, so "eggs"
+# does not resolve to "Mayonnaise without eggs" nor "rice" to "Spanish rice";
+# the name's last word (what the dish is: "Bread upma", "Egg nog") has to be
+# covered as well
+MIN_PRECISION = 0.6
+
+# Bump when the matching rules change so stored tables are rebuilt
+LINKS_VERSION = 2
+
+# Placeholders used in plans when a meal has no suggestion
+MISSING = {'', 'n/a', 'none'}
+
+
+def dish_key(text):
+    """Lookup key of a dish name: lower case with whitespace collapsed"""
+    return ' '.join(str(text).lower().split())
+
+
+def content_words(text):
+    """Plural-folded words of a name without stopwords; a final 'e' is dropped
+    too, as tokenize folds 'potatoes' to 'potatoe'"""
+    return [w[:-1] if w.endswith('e') else w for w in tokenize(text) if w not in STOPWORDS]
+
+
+def _slots(text):
+    """Words of one name, each a set of alternatives ("parantha/paratha")"""
+    slots = []
+    for token in text.split():
+        alternatives = {w for piece in token.split('/') for w in content_words(piece)}
+        if alternatives:
+            slots.append(alternatives)
+    return slots
+
+
+@lru_cache(maxsize=None)
+def food_names(name):
+    """The names an INDB food goes by, as (word slots, whether the name is compound)"""
+    name = str(name)
+    main = _BRACKETS.sub(' ', name)
+    texts = [main] + [alias for text in _BRACKETS.findall(name) if text.strip()[:1].isupper()
+                      for alias in _ALIAS_SPLIT.split(text)]
+    names = []
+    for text in texts:
+        slots = _slots(text)
+        if slots:
+            names.append((slots, bool(_COMPOUND.search(f' {text} '))))
+    return names
+
+
+def _precision(wanted, slots, compound):
+    """Share of the name's words the dish part covers, or 0 when it is not a match"""
+    if not all(any(w in slot for slot in slots) for w in wanted):
+        return 0.0
+    covered = [not slot.isdisjoint(wanted) for slot in slots]
+    if not covered[-1]:
+        return 0.0
+    precision = sum(covered) / len(slots)
+    return precision if precision >= (1.0 if compound else MIN_PRECISION) else 0.0
+
+
+def match_part(part, engine, search):
+    """INDB row best covering a dish part, or -1.
+
+    Every word of the part must be a word of one of the food's names, and
+    the part must account for that name's last word and at least
+    MIN_PRECISION of its words (all of them for a compound name). The most
+    precise match wins, then the shortest name, so "rice" is "Boiled rice"
+    rather than "Spanish rice" and "roti" is "Chapati/Roti".
+    """
+    wanted = content_words(part)
+    if not wanted:
+        return -1
+    found, _ = search.search(part, CANDIDATES)
+    best, best_key = -1, None
+    for row in found:
+        for slots, compound in food_names(engine.names[row]):
+            precision = _precision(wanted, slots, compound)
+            if precision:
+                key = (-precision, len(slots), len(str(engine.names[row])), int(row))
+                if best_key is None or key < best_key:
+                    best, best_key = int(row), key
+    return best
+
+
+def resolve(dish, engine, search):
+    """INDB rows a dish is made of, and whether every part of it was found.
+
+    The whole name is tried first, then its parts recursively.
+    """
+    row = match_part(dish, engine, search)
+    if row >= 0:
+        return [row], True
+    parts = [p for p in SEPARATORS.split(dish) if p.strip()]
+    if len(parts) < 2:
+        return [], False
+    rows, complete = [], True
+    for part in parts:
+        part_rows, part_complete = resolve(part, engine, search)
+        rows.extend(r for r in part_rows if r not in rows)
+        complete = complete and part_complete
+    return rows, complete
+
+
+class MealLinks:
+    """Lookup table from free-text dish names to the INDB rows they are made of.
+
+    Every known dish (profile suggestions, curated meals) is resolved once per
+    dataset version into a sorted key array with CSR rows, and its nutrients
+    per serving summed, so a plan's nutrition is a searchsorted and a gather.
+    Names outside the table (Spoonacular titles) are resolved on first use
+    and cached.
+    """
+
+    def __init__(self, engine, search, dishes=(), arrays=None):
+        if arrays is None:
+            arrays = self.index_arrays(dishes, engine, search)
+        self.engine = engine
+        self.search = search
+        self.keys = arrays['keys']
+        self.offsets = arrays['offsets']
+        self.rows = arrays['rows']
+        counts = np.diff(self.offsets)
+        self.nutrients = np.zeros((len(self.keys), len(NUTRIENTS)))
+        np.add.at(self.nutrients, np.repeat(np.arange(len(self.keys)), counts), engine.per_serving[self.rows])
+        self.resolved = counts > 0
+        self.complete = arrays['complete']
+        self._extra = lru_cache(maxsize=4096)(self._resolve)
+
+    @staticmethod
+    def index_arrays(dishes, engine, search):
+        keys = np.array(sorted({dish_key(d) for d in dishes if dish_key(d) not in MISSING}), dtype=str)
+        links = [resolve(key, engine, search) for key in keys]
+        offsets = np.zeros(len(links) + 1, dtype=np.int64)
+        np.cumsum([len(rows) for rows, _ in links], out=offsets[1:])
+        rows = np.array([r for rows, _ in links for r in rows], dtype=np.int64)
+        complete = np.array([bool(rows) and ok for rows, ok in links], dtype=bool)
+        return {'keys': keys, 'offsets': offsets, 'rows': rows, 'complete': complete}
+
+    def _resolve(self, key):
+        rows, complete = resolve(key, self.engine, self.search)
+        return tuple(rows), complete
+
+    def __len__(self):
+        return len(self.keys)
+
+    def link(self, dishes):
+        """Table entry of each dish name (-1 when absent), for any array shape"""
+        names = np.asarray(dishes, dtype=object)
+        keys = np.array([dish_key(d) for d in names.ravel()], dtype=str)
+        pos = np.searchsorted(self.keys, keys)
+        pos[pos >= len(self.keys)] = 0
+        hit = (self.keys[pos] == keys) if len(self.keys) else np.zeros(len(keys), dtype=bool)
+        return np.where(hit, pos, -1).reshape(names.shape)
+
+    def _rows(self, i, dish):
+        """INDB rows of a dish given its table entry i, and whether they cover all of it"""
+        if i >= 0:
+            return self.rows[self.offsets[i]:self.offsets[i + 1]].tolist(), bool(self.complete[i])
+        key = dish_key(dish) if dish is not None else ''
+        if key in MISSING:
+            return [], False
+        rows, complete = self._extra(key)
+        return list(rows), complete
+
+    def parts(self, dishes):
+        """INDB rows of many dish names as flat arrays: the position of the dish and the row.
+
+        Table entries are gathered straight from the CSR arrays; only names
+        outside the table go through the (cached) matcher.
+        """
+        idx = self.link(dishes).ravel()
+        hit = np.flatnonzero(idx >= 0)
+        starts = self.offsets[idx[hit]]
+        lengths = self.offsets[idx[hit] + 1] - starts
+        owner = [np.repeat(hit, lengths)]
+        rows = [self.rows[np.repeat(starts - np.cumsum(lengths) + lengths, lengths) + np.arange(lengths.sum())]]
+        flat = np.asarray(dishes, dtype=object).ravel()
+        for i in np.flatnonzero(idx < 0):
+            found, _ = self._rows(-1, flat[i])
+            owner.append(np.full(len(found), i))
+            rows.append(np.asarray(found, dtype=np.int64))
+        return np.concatenate(owner).astype(np.int64), np.concatenate(rows).astype(np.int64)
+
+    def rows_of(self, dish):
+        """INDB rows of one dish name"""
+        return self._rows(self.link([dish])[0], dish)[0]
+
+    def join(self, dishes):
+        """Nutrients per dish (one serving of each part), a resolved mask and the table
+        entries, for an array of dish names"""
+        names = np.asarray(dishes, dtype=object)
+        idx = self.link(names).ravel()
+        nutrients = np.zeros((idx.size, len(NUTRIENTS)))
+        hit = idx >= 0
+        nutrients[hit] = self.nutrients[idx[hit]]
+        resolved = hit & self.resolved[np.maximum(idx, 0)] if len(self.keys) else hit
+        # Names outside the table, matched once per process
+        flat = names.ravel()
+        for name in {flat[i] for i in np.flatnonzero(~hit)}:
+            rows, _ = self._rows(-1, name)
+            if rows:
+                where = np.flatnonzero(~hit & (flat == name))
+                nutrients[where] = self.engine.per_serving[rows].sum(axis=0)
+                resolved[where] = True
+        shape = names.shape
+        return nutrients.reshape(shape + (len(NUTRIENTS),)), resolved.reshape(shape), idx.reshape(shape)
+
+    def format(self, plan, meals):
+        """Per-meal and per-day nutrient totals of a plan (dicts with a 'day' and one dish per meal)"""
+        dishes = [[row.get(meal) for meal in meals] for row in plan]
+        if not dishes:
+            return []
+        nutrients, resolved, idx = self.join(dishes)
+        day_totals = nutrients.sum(axis=1).round(1).tolist()
+        meal_values = nutrients.round(1).tolist()
+        result = []
+        for d, row in enumerate(plan):
+            entry = {'day': row.get('day'), 'meals': {}}
+            for m, meal in enumerate(meals):
+                if not resolved[d, m]:
+                    entry['meals'][meal] = None
+                    continue
+                rows, complete = self._rows(idx[d, m], dishes[d][m])
+                entry['meals'][meal] = {
+                    'dish': dishes[d][m],
+                    'food_codes': [self.engine.codes[r] for r in rows],
+                    'complete': complete,
+                    **dict(zip(NUTRIENTS, meal_values[d][m])),
+                }
+            entry['totals'] = dict(zip(NUTRIENTS, day_totals[d]))
+            entry['resolved'] = int(resolved[d].sum())
+            result.append(entry)
+        return result
@@ -0,0 +1,114 @@
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Share of requests whose stage timings are recorded (the profiling header
+# always records its own request)
+SAMPLE_RATE = float(os.getenv('PLAN_METRICS_SAMPLE', '1'))
+
+# Upper bounds in seconds, from sub-millisecond index lookups to slow upstream calls
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+_sampler = random.Random()
+
+# Stage timings of the current request, or None when it is not sampled
+_timings = contextvars.ContextVar('timings', default=None)
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by one label, rendered in Prometheus text format"""
+
+    def __init__(self, name, help, label='stage', buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label, value):
+        with self._lock:
+            counts = self.series.get(label)
+            if counts is None:
+                # Bucket counts, then the running sum and count
+                counts = self.series[label] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {k: list(v) for k, v in self.series.items()}
+        for label, counts in sorted(series.items()):
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{{{self.label}="{label}",le="{bound:g}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{self.label}="{label}",le="+Inf"}} {counts[-1]}')
+            lines.append(f'{self.name}_sum{{{self.label}="{label}"}} {counts[-2]:.6f}')
+            lines.append(f'{self.name}_count{{{self.label}="{label}"}} {counts[-1]}')
+        return '\n'.join(lines) + '\n'
+
+
+PLAN_STAGES = Histogram('plan_stage_seconds', 'Time spent in each stage of /plan')
+
+REGISTRY = [PLAN_STAGES]
+
+
+def start_request(profile=False):
+    """Start timing a request when it is sampled or explicitly profiled; returns its timings dict or None"""
+    timings = {} if profile or _sampler.random() < SAMPLE_RATE else None
+    _timings.set(timings)
+    return timings
+
+
+@contextmanager
+def stage(name, histogram=PLAN_STAGES):
+    """Time a block into the histogram and the request's timings (no-op when not sampled)"""
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        histogram.observe(name, elapsed)
+        timings[name] = timings.get(name, 0.0) + elapsed
+
+
+def timed():
+    """Whether the current request records stage timings"""
+    return _timings.get() is not None
+
+
+def collect(enabled):
+    """Time the stages that follow into a fresh dict (None when not enabled), e.g. in a
+    worker process whose timings go back to the request with record()"""
+    timings = {} if enabled else None
+    _timings.set(timings)
+    return timings
+
+
+def record(timings, histogram=PLAN_STAGES):
+    """Add stage timings measured elsewhere to the histogram and the current request"""
+    current = _timings.get()
+    if not timings or current is None:
+        return
+    for name, elapsed in timings.items():
+        histogram.observe(name, elapsed)
+        current[name] = current.get(name, 0.0) + elapsed
+
+
+def server_timing(timings):
+    """Server-Timing header value (durations in milliseconds)"""
+    return ', '.join(f'{name};dur={seconds * 1000:.2f}' for name, seconds in timings.items())
+
+
+def render():
+    return ''.join(h.render() for h in REGISTRY)
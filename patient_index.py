@@ -0,0 +1,65 @@
+import numpy as np
+import pandas as pd
+from sklearn.neighbors import KDTree
+
+# Numeric features used to compare a user with the patients in the dataset
+FEATURES = ['age', 'height_cm', 'weight_kg']
+
+# Patient attributes reported for the neighbours and voted on
+LABELS = ['diet_recommendation', 'dietary_restrictions', 'allergies']
+
+
+class PatientIndex:
+    """k-nearest-neighbour lookup over the patients of diet_recommendations_dataset.csv.
+
+    Features are standardized once and one KD-tree is built per gender, so a
+    lookup is a single tree query instead of a scan of the frame. Expects the
+    snake_case column names app.py normalizes to.
+    """
+
+    def __init__(self, df, features=FEATURES, leaf_size=16):
+        self.features = [f for f in features if f in df.columns]
+        self.labels = [c for c in LABELS if c in df.columns]
+        X = df[self.features].apply(pd.to_numeric, errors='coerce').to_numpy(dtype=float)
+        keep = ~np.isnan(X).any(axis=1)
+        self.rows = {c: df.loc[keep, c].fillna('None').astype(str).to_numpy(dtype=object) for c in self.labels}
+        self.size = int(keep.sum())
+        X = X[keep]
+        self.trees = {}
+        if not self.size:
+            return
+        self.mean = X.mean(axis=0)
+        self.scale = X.std(axis=0)
+        self.scale[self.scale == 0] = 1.0
+        Z = (X - self.mean) / self.scale
+
+        gender = df.loc[keep, 'gender'].astype(str).str.lower().to_numpy() if 'gender' in df.columns \
+            else np.full(len(Z), '')
+        # One tree per gender plus one over everyone for unlisted genders
+        self.trees[None] = (KDTree(Z, leaf_size=leaf_size), np.arange(len(Z)))
+        for g in np.unique(gender):
+            idx = np.flatnonzero(gender == g)
+            self.trees[g] = (KDTree(Z[idx], leaf_size=leaf_size), idx)
+
+    def __len__(self):
+        return self.size
+
+    def query(self, age, gender, height, weight, k=5):
+        """The k most similar patients with their labels and a 'distance' column"""
+        if not self.size:
+            return pd.DataFrame(columns=self.labels + ['distance'])
+        values = {'age': age, 'height_cm': height, 'weight_kg': weight}
+        z = (np.array([[values[f] for f in self.features]], dtype=float) - self.mean) / self.scale
+        tree, idx = self.trees.get((gender or '').lower(), self.trees[None])
+        dist, pos = tree.query(z, k=min(k, len(idx)))
+        rows = idx[pos[0]]
+        return pd.DataFrame({**{c: v[rows] for c, v in self.rows.items()}, 'distance': dist[0]})
+
+    @staticmethod
+    def vote(neighbours, column):
+        """Label with the largest inverse-distance weight among the neighbours"""
+        if neighbours.empty or column not in neighbours.columns:
+            return None
+        weights = 1.0 / (neighbours['distance'].to_numpy() + 1e-6)
+        totals = pd.Series(weights).groupby(neighbours[column].to_numpy()).sum()
+        return totals.idxmax()
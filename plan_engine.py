@@ -0,0 +1,223 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from shared import StringArray
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+# Share of the daily calorie target given to each meal
+MEAL_SPLIT = {'Breakfast': 0.3, 'Lunch': 0.4, 'Dinner': 0.3}
+
+NUTRIENTS = ['energy_kcal', 'carb_g', 'protein_g', 'fat_g', 'fibre_g', 'sodium_mg', 'freesugar_g']
+
+# Servings are picked in half steps within this range
+MIN_SERVINGS = 0.5
+MAX_SERVINGS = 3.0
+
+# Foods whose single serving falls outside this range (tea, pickles, party
+# platters) are not offered as a meal on their own
+MIN_SERVING_KCAL = 80
+MAX_SERVING_KCAL = 1200
+
+# Candidate foods may be this much denser in a limited nutrient than the day allows
+DENSITY_SLACK = float(os.getenv('PLAN_DENSITY_SLACK', '1.25'))
+
+SERVING_STEPS = np.arange(MIN_SERVINGS, MAX_SERVINGS + 0.25, 0.5)
+
+# Nutrient each restricted diet additionally tries to keep low
+DIET_FOCUS = {'Low_Sugar': 'freesugar_g', 'Low_Sodium': 'sodium_mg', 'Low_Carb': 'carb_g'}
+
+
+def day_label(d, days):
+    """Weekday names for plans of up to a week, 'Day n' beyond that"""
+    return DAYS[d % 7] if days <= 7 else f'Day {d + 1}'
+
+
+def daily_limits(rec_cal, diet_type):
+    """Upper bounds per day for the nutrients each diet type restricts"""
+    limits = {
+        'sodium_mg': 2000.0,
+        'freesugar_g': rec_cal * 0.10 / 4,  # 10% of energy from free sugars
+        'fat_g': rec_cal * 0.35 / 9,         # 35% of energy from fat
+    }
+    if diet_type == 'Low_Sugar':
+        limits['freesugar_g'] = rec_cal * 0.05 / 4
+    elif diet_type == 'Low_Sodium':
+        limits['sodium_mg'] = 1500.0
+    elif diet_type == 'Low_Carb':
+        limits['carb_g'] = rec_cal * 0.26 / 4
+        # With carbs at 26% and fat at 35%, protein would need 39% of energy,
+        # which almost no dish has; low-carb diets make up the energy with fat
+        limits['fat_g'] = rec_cal * 0.50 / 9
+    return limits
+
+
+def day_score(totals, rec_cal, diet_type):
+    """Penalty of day totals (..., nutrients): calorie miss, limits exceeded, the diet's focus nutrient"""
+    score = np.abs(totals[..., 0] - rec_cal) / rec_cal
+    for nutrient, limit in daily_limits(rec_cal, diet_type).items():
+        ratio = totals[..., NUTRIENTS.index(nutrient)] / limit
+        score += 4 * np.maximum(ratio - 1, 0)
+        if nutrient == DIET_FOCUS.get(diet_type):
+            score += 0.1 * ratio
+    # Small reward for reaching ~15% of energy from protein
+    protein_target = rec_cal * 0.15 / 4
+    score -= 0.05 * np.minimum(totals[..., NUTRIENTS.index('protein_g')] / protein_target, 1)
+    return score
+
+
+class PlanEngine:
+    """Builds nutrient-targeted day plans from INDB servings.
+
+    Per-serving nutrients are kept as one (foods x nutrients) matrix. For each
+    day a handful of candidates is drawn per meal, servings are scaled towards
+    the meal's calorie share, and every breakfast/lunch/dinner combination is
+    scored at once with NumPy broadcasting. Names, codes and units are
+    StringArrays beside the matrix, so a plan never touches the frame.
+    """
+
+    def __init__(self, foods_df=None, candidates=12, arrays=None):
+        self.candidates = candidates
+        if arrays is None:
+            arrays = self.index_arrays(foods_df)
+        self.per_serving = arrays['per_serving']
+        self.pool = arrays['pool']
+        self.names = StringArray.from_arrays(arrays, 'names')
+        self.codes = StringArray.from_arrays(arrays, 'codes')
+        self.units = StringArray.from_arrays(arrays, 'units')
+
+    @staticmethod
+    def index_arrays(foods_df):
+        """Per-serving nutrient matrix, usable food rows and food labels as arrays"""
+        df = foods_df.reset_index(drop=True)
+        per_100g = np.column_stack([
+            pd.to_numeric(df[c], errors='coerce').to_numpy(dtype=float) if c in df.columns
+            else np.zeros(len(df))
+            for c in NUTRIENTS
+        ])
+        per_serving = np.column_stack([
+            pd.to_numeric(df['unit_serving_' + c], errors='coerce').to_numpy(dtype=float)
+            if 'unit_serving_' + c in df.columns else np.full(len(df), np.nan)
+            for c in NUTRIENTS
+        ])
+        # Foods without a household serving are measured per 100 g
+        no_unit = np.isnan(per_serving[:, 0])
+        per_serving[no_unit] = per_100g[no_unit]
+        per_serving = np.nan_to_num(per_serving)
+        units = df['servings_unit'].astype(object).where(~no_unit, '100 g') if 'servings_unit' in df.columns \
+            else pd.Series(['100 g'] * len(df))
+
+        kcal = per_serving[:, 0]
+        usable = (kcal >= MIN_SERVING_KCAL) & (kcal <= MAX_SERVING_KCAL)
+        codes = df['food_code'].astype(str) if 'food_code' in df.columns else np.arange(len(df)).astype(str)
+        return {
+            'per_serving': per_serving,
+            'pool': np.flatnonzero(usable),
+            **StringArray.pack(df['food_name'].astype(str)).arrays('names'),
+            **StringArray.pack(codes).arrays('codes'),
+            **StringArray.pack(units.fillna('serving').astype(str)).arrays('units'),
+        }
+
+    def build(self, rec_cal, diet_type='Balanced', days=7, seed=None, mask=None):
+        """Plan `days` days of breakfast/lunch/dinner close to rec_cal within the diet's limits.
+
+        mask, if given, is a boolean array over the foods marking the ones to
+        leave out (allergens, diet preference). Passing seed makes the plan
+        deterministic.
+        """
+        return self.format(*self.choose(rec_cal, diet_type, days, seed, mask))
+
+    def choose(self, rec_cal, diet_type='Balanced', days=7, seed=None, mask=None):
+        """The plan as arrays: food rows and servings, both shaped (days, meals)"""
+        rng = np.random.default_rng(seed)
+        pool = self.pool if mask is None else self.pool[~np.asarray(mask)[self.pool]]
+        if len(pool) == 0:
+            return np.empty((0, len(MEAL_SPLIT)), dtype=np.int64), np.empty((0, len(MEAL_SPLIT)))
+        meals = list(MEAL_SPLIT)
+        pool = self.within_limits(pool, rec_cal, diet_type, days * len(meals))
+        k = min(self.candidates, len(pool))
+
+        # Candidate foods for every (day, meal), without repeats across the
+        # plan when the pool is large enough
+        need = days * len(meals) * k
+        picks = rng.permutation(pool)[:need] if need <= len(pool) else rng.choice(pool, need)
+        picks = picks.reshape(days, len(meals), k)
+
+        # Scale each candidate to the calorie share of its meal
+        nut = self.per_serving[picks]                                    # (d, m, k, n)
+        share = np.array([MEAL_SPLIT[m] for m in meals]) * rec_cal      # (m,)
+        servings = np.round(share[None, :, None] / nut[..., 0] * 2) / 2
+        servings = np.clip(servings, MIN_SERVINGS, MAX_SERVINGS)
+        nut = nut * servings[..., None]
+
+        # Day totals for all k**3 breakfast/lunch/dinner combinations
+        totals = (nut[:, 0, :, None, None, :] + nut[:, 1, None, :, None, :]
+                  + nut[:, 2, None, None, :, :]).reshape(days, k ** 3, len(NUTRIENTS))
+        best = day_score(totals, rec_cal, diet_type).argmin(axis=1)     # (d,)
+        choice = np.stack(np.unravel_index(best, (k, k, k)), axis=1)     # (d, m)
+        day_idx = np.arange(days)[:, None]
+        meal_idx = np.arange(len(meals))[None, :]
+        chosen = picks[day_idx, meal_idx, choice]
+        return chosen, self.repair(chosen, rec_cal, diet_type)
+
+    def within_limits(self, pool, rec_cal, diet_type, minimum):
+        """Foods of the pool that a day could hold without busting a daily limit.
+
+        A food with more of a limited nutrient per kcal than DENSITY_SLACK times
+        the day's budget (limit / rec_cal) can only fit next to very light
+        meals, so it is left out; the slack doubles while fewer than `minimum`
+        foods remain (small pools after allergen and diet exclusions).
+        """
+        kcal = np.maximum(self.per_serving[pool, 0], 1)
+        density = {n: self.per_serving[pool, NUTRIENTS.index(n)] / kcal / (limit / rec_cal)
+                   for n, limit in daily_limits(rec_cal, diet_type).items()}
+        worst = np.max(list(density.values()), axis=0)
+        for slack in (DENSITY_SLACK, 2 * DENSITY_SLACK, 4 * DENSITY_SLACK):
+            keep = worst <= slack
+            if keep.sum() >= minimum:
+                return pool[keep]
+        return pool
+
+    def repair(self, chosen, rec_cal, diet_type='Balanced'):
+        """Servings of the chosen foods re-picked together, every half-step combination per day.
+
+        Candidates are scaled one meal at a time, so a low-carb dinner cannot
+        make up for a light breakfast; scoring all SERVING_STEPS**3 servings
+        of the day at once closes most of that gap.
+        """
+        days, meals = chosen.shape
+        n = len(SERVING_STEPS)
+        grid = np.stack(np.meshgrid(*[SERVING_STEPS] * meals, indexing='ij'), axis=-1).reshape(-1, meals)
+        # (d, combinations, nutrients): servings of each meal times its food's nutrients
+        totals = np.einsum('cm,dmn->dcn', grid, self.per_serving[chosen])
+        best = day_score(totals, rec_cal, diet_type).argmin(axis=1)
+        return grid[best] if n else np.empty((days, meals))
+
+    def format(self, chosen, chosen_servings, start=0, total_days=None):
+        """Plan dicts, one per day, from the arrays returned by choose().
+
+        start and total_days label a chunk of a longer plan.
+        """
+        meals = list(MEAL_SPLIT)
+        days = len(chosen)
+        total_days = total_days or days
+        chosen_nut = self.per_serving[chosen] * chosen_servings[..., None]
+        day_totals = chosen_nut.sum(axis=1)
+
+        plan = []
+        for d in range(days):
+            entry = {'day': day_label(start + d, total_days), 'meals': {}}
+            for m, meal in enumerate(meals):
+                i = chosen[d, m]
+                entry['meals'][meal] = {
+                    'food_code': self.codes[i],
+                    'food_name': self.names[i],
+                    'servings': float(chosen_servings[d, m]),
+                    'servings_unit': self.units[i],
+                    **{c: round(float(v), 1) for c, v in zip(NUTRIENTS, chosen_nut[d, m])},
+                }
+            entry['totals'] = {c: round(float(v), 1) for c, v in zip(NUTRIENTS, day_totals[d])}
+            plan.append(entry)
+        return plan
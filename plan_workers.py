@@ -0,0 +1,310 @@
+import asyncio
+import contextvars
+import hashlib
+import itertools
+import multiprocessing
+import os
+from contextlib import asynccontextmanager
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor, ThreadPoolExecutor
+
+import metrics
+from rotation import NO_REPEAT_DAYS, rotate
+
+# Where /plan builds its days: 'thread', 'process' (separate interpreters, each
+# mapping the shared indexes) or 'inline' (on the event loop, as before)
+PLAN_BACKEND = os.getenv('PLAN_BACKEND', 'thread')
+BACKENDS = ('thread', 'process', 'inline')
+
+PLAN_WORKERS = int(os.getenv('PLAN_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+# Plans allowed to wait for a free worker; beyond that /plan answers 503 at once
+PLAN_QUEUE = int(os.getenv('PLAN_QUEUE', '32'))
+
+# Seconds a request waits for its plan, and the Retry-After sent when saturated
+PLAN_TIMEOUT = float(os.getenv('PLAN_TIMEOUT', '10'))
+PLAN_RETRY_AFTER = os.getenv('PLAN_RETRY_AFTER', '1')
+
+# Long plans are produced this many days at a time, each step finished
+# (dishes, INDB servings, nutrition) before the next one starts
+PLAN_CHUNK = 7
+
+
+class PoolSaturated(Exception):
+    """Every worker is busy and the queue is full"""
+
+
+class PlanTimeout(Exception):
+    """The plan was not ready within the pool's timeout"""
+
+
+class StaleSnapshot(Exception):
+    """A process worker could only load data other than the job's snapshot
+    (the sources changed on disk and the parent has not reloaded yet)"""
+
+
+def chunk_seed(seed, start):
+    """Seed of the nutrient plan for the days from `start`; None stays random"""
+    if seed is None:
+        return None
+    return int.from_bytes(hashlib.blake2b(f'{seed}|{start}'.encode(), digest_size=8).digest(), 'big')
+
+
+def plan_chunks(options, days, window=NO_REPEAT_DAYS, seed=None):
+    """(first day, plan rows) PLAN_CHUNK days at a time; dishes rotate so none
+    repeats in its meal within `window` days"""
+    rows = rotate(options, days, window, seed)
+    for start in range(0, days, PLAN_CHUNK):
+        yield start, list(itertools.islice(rows, min(PLAN_CHUNK, days - start)))
+
+
+def plan_chunk(snap, chunk, meals, start, days, rec_cal, diet_type, food_mask=None, seed=None):
+    """(INDB servings, nutrition) for each day of chunk, whose first day is `start`"""
+    n = len(chunk)
+    # Servings from INDB that hit rec_cal within the diet's nutrient limits
+    servings = None
+    if snap.plan_engine is not None:
+        with metrics.stage('nutrient_plan'):
+            picks = snap.plan_engine.choose(rec_cal, diet_type, n, chunk_seed(seed, start), mask=food_mask)
+            servings = snap.plan_engine.format(*picks, start=start, total_days=days)
+    # Calories and macros per planned dish and day, joined from the dish -> INDB table
+    nutrition = None
+    if snap.meal_links is not None:
+        with metrics.stage('meal_nutrition'):
+            nutrition = snap.meal_links.format(chunk, meals)
+    return servings or [None] * n, nutrition or [None] * n
+
+
+def plan_days(snap, options, days, rec_cal, diet_type, food_mask=None, window=NO_REPEAT_DAYS, seed=None):
+    """(dishes, INDB servings, nutrition) for each day, produced PLAN_CHUNK days at a time.
+
+    Memory and work per step do not depend on the plan's length. The same
+    seed gives the same dishes and servings, streamed or not.
+    """
+    meals = list(options)
+    for start, chunk in plan_chunks(options, days, window, seed):
+        yield from zip(chunk, *plan_chunk(snap, chunk, meals, start, days, rec_cal, diet_type, food_mask, seed))
+
+
+def compose_plan(snap, options, days, rec_cal, diet_type, excluded=(), window=NO_REPEAT_DAYS, seed=None):
+    """The CPU-bound part of /plan: (plan, nutrient_plan, meal_nutrition, shopping_list).
+
+    excluded are the allergens and diet preference words (allergens.exclusions)
+    whose INDB foods the nutrient plan leaves out.
+    """
+    food_mask = None
+    if excluded and snap.plan_engine is not None:
+        with metrics.stage('nutrient_plan'):
+            food_mask = snap.food_allergens.mask(excluded)
+    plan, nutrient_plan, meal_nutrition = [], [], []
+    for row, servings, nutrition in plan_days(snap, options, days, rec_cal, diet_type, food_mask, window, seed):
+        plan.append(row)
+        if servings is not None:
+            nutrient_plan.append(servings)
+        if nutrition is not None:
+            meal_nutrition.append(nutrition)
+
+    # Shopping list: every planned dish resolved to INDB and summed in household servings
+    shopping_list = None
+    if snap.shopping is not None:
+        with metrics.stage('shopping_list'):
+            shopping_list = snap.shopping.from_dishes([row.get(m) for row in plan for m in options])
+    return plan, nutrient_plan, meal_nutrition, shopping_list
+
+
+def household_shopping(snap, rec_cals, diets, excluded, days):
+    """One consolidated shopping list for every member's INDB plan over `days` days.
+
+    excluded holds each member's allergens.exclusions().
+    """
+    picks = []
+    with metrics.stage('nutrient_plan'):
+        for rec_cal, diet_type, words in zip(rec_cals, diets, excluded):
+            mask = snap.food_allergens.mask(words) if words else None
+            picks.append(snap.plan_engine.choose(rec_cal, diet_type, days=days, mask=mask))
+    with metrics.stage('shopping_list'):
+        return snap.shopping.consolidate(picks)
+
+
+def load_snapshot(extra_dishes=()):
+    """A fresh snapshot of the default datasets, e.g. a process worker's own"""
+    from snapshot import DIET_PATH, DataSnapshot
+    return DataSnapshot.load(DIET_PATH, extra_dishes)
+
+
+# A process worker's own snapshot and the source stamps it was loaded from
+_worker_load = None
+_worker_snap = None
+_worker_stamps = None
+
+
+def _init_worker(load):
+    global _worker_load, _worker_snap, _worker_stamps
+    _worker_load = load
+    _worker_snap = load()
+    _worker_stamps = _worker_snap.stamps
+
+
+def _run_in_worker(fn, stamps, args, timed):
+    """fn on this process's snapshot, reloaded first when the job's snapshot has other stamps.
+
+    Raises StaleSnapshot when the data on disk no longer matches the job's
+    snapshot either, rather than planning from other data than the parent's.
+    Returns fn's result and, when the parent's request is timed, its stage
+    timings for the parent to record.
+    """
+    global _worker_snap, _worker_stamps
+    if stamps != _worker_stamps:
+        _worker_snap = _worker_load()
+        _worker_stamps = _worker_snap.stamps
+        if stamps != _worker_stamps:
+            raise StaleSnapshot()
+    timings = metrics.collect(timed)
+    return fn(_worker_snap, *args), timings
+
+
+class _Slot:
+    """One of the pool's places, held until its job ends (or it is given back unused)"""
+
+    def __init__(self, pool, semaphore):
+        self.pool = pool
+        self.semaphore = semaphore
+        self.running = False
+        self.freed = False
+
+    def free(self):
+        if not self.freed:
+            self.freed = True
+            self.pool.pending -= 1
+            self.semaphore.release()
+
+
+class PlanPool:
+    """Bounded executor that keeps plan construction off the event loop.
+
+    At most workers + queue plans are in flight; past that run() fails fast
+    with PoolSaturated instead of piling up work, and a caller stops waiting
+    after `timeout` seconds. A slot is only freed when its job really ends,
+    so plans that timed out still count until their worker is done.
+
+    Process workers cannot share the parent's snapshot: each loads its own
+    with load() (cheap, the indexes are memory-mapped) and reloads when a
+    job comes from a snapshot with different source stamps. A job whose
+    stamps the reloaded data still does not match fails with StaleSnapshot.
+    """
+
+    def __init__(self, backend=PLAN_BACKEND, workers=PLAN_WORKERS, queue=PLAN_QUEUE, timeout=PLAN_TIMEOUT, load=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"PLAN_BACKEND must be one of: {', '.join(BACKENDS)}")
+        if backend == 'process' and load is None:
+            raise ValueError("the process backend needs a snapshot loader")
+        self.backend = backend
+        self.workers = max(1, workers)
+        self.limit = self.workers + max(0, queue)
+        self.timeout = timeout
+        self.load = load
+        self.pending = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._executor = None
+        self._loop = None
+        self._slots = None
+
+    def _start(self):
+        if self._executor is None:
+            if self.backend == 'process':
+                # spawn: forking a process that runs threads (uvicorn, the data watcher) is unsafe
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                                     initializer=_init_worker, initargs=(self.load,))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='plan')
+        return self._executor
+
+    def _semaphore(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop, self._slots = loop, asyncio.Semaphore(self.limit)
+        return self._slots
+
+    async def _acquire(self, wait):
+        if self.backend == 'inline':
+            return None
+        slots = self._semaphore()
+        if slots.locked() and not wait:
+            self.rejected += 1
+            raise PoolSaturated()
+        await slots.acquire()
+        self.pending += 1
+        return _Slot(self, slots)
+
+    @asynccontextmanager
+    async def reserve(self, wait=False):
+        """Hold a slot for one run() from before a request's other work.
+
+        A full pool then turns the request away before it spends time on the
+        diet model or dish options. The slot goes to the run() it is passed
+        to, or back to the pool on leaving the block when it was not used.
+        """
+        slot = await self._acquire(wait)
+        try:
+            yield slot
+        finally:
+            if slot is not None and not slot.running:
+                slot.free()
+
+    async def run(self, fn, snap, *args, wait=False, slot=None):
+        """fn(snap, *args) on a worker, in slot when one was reserved.
+
+        Raises PoolSaturated when every slot is taken (wait=True queues for
+        one instead, for streams that cannot answer 503 half-way),
+        PlanTimeout when the result takes longer than the timeout and
+        StaleSnapshot when a process worker cannot load the snapshot's data.
+        """
+        if self.backend == 'inline':
+            return fn(snap, *args)
+        reserved = slot is not None
+        if not reserved:
+            slot = await self._acquire(wait)
+        loop = self._loop
+
+        def finished(_):
+            try:
+                loop.call_soon_threadsafe(slot.free)
+            except RuntimeError:
+                pass  # the loop is gone
+
+        try:
+            if self.backend == 'process':
+                future = self._start().submit(_run_in_worker, fn, snap.stamps, args, metrics.timed())
+            else:
+                # Copy the context so metrics.stage() records into this request's timings
+                future = self._start().submit(contextvars.copy_context().run, fn, snap, *args)
+        except BaseException:
+            if not reserved:
+                slot.free()
+            raise
+        slot.running = True
+        future.add_done_callback(finished)
+        try:
+            # A plan still queued when this times out is cancelled and frees its slot
+            result = await asyncio.wait_for(asyncio.wrap_future(future), self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise PlanTimeout()
+        except BrokenExecutor:
+            # A worker died; start a fresh pool for the next request
+            self.shutdown()
+            raise
+        if self.backend == 'process':
+            # Stages timed in the worker count towards this request like the thread backend's
+            result, timings = result
+            metrics.record(timings)
+        return result
+
+    def stats(self):
+        return {'backend': self.backend, 'workers': self.workers, 'limit': self.limit, 'pending': self.pending,
+                'rejected': self.rejected, 'timeouts': self.timeouts}
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
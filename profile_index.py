@@ -0,0 +1,160 @@
+import numpy as np
+import pandas as pd
+
+from shared import StringArray
+
+# Diseases offered by the form; their buckets are built eagerly at startup.
+KNOWN_DISEASES = ['Diabetes', 'Hypertension', 'Obesity']
+
+SUGGESTION_COLS = ['Breakfast Suggestion', 'Lunch Suggestion', 'Dinner Suggestion', 'Snack Suggestion']
+
+
+def _text(series):
+    """Cast a column to str the way /plan always has (NaN becomes 'nan')"""
+    return series.astype(object).astype(str).to_numpy(dtype=object)
+
+
+class _Bucket:
+    """Row positions of one profile group, ordered by age (missing ages last)"""
+
+    def __init__(self, positions, ages):
+        valid = ~np.isnan(ages)
+        # Stable sort so rows with the same age keep their file order
+        order = np.argsort(ages[valid], kind='stable')
+        self.ages = ages[valid][order]
+        self.positions = np.concatenate([positions[valid][order], positions[~valid]])
+
+    def __len__(self):
+        return len(self.positions)
+
+    def nearest(self, age, k, exclude=None):
+        """Positions of the k rows closest to age, ties broken by file order.
+
+        exclude is an optional boolean array over all rows marking rows to skip.
+        """
+        ages, positions = self.ages, self.positions
+        if exclude is not None:
+            keep = ~exclude[positions]
+            ages, positions = ages[keep[:len(ages)]], positions[keep]
+        n_valid = len(ages)
+        if age is None or n_valid == 0:
+            return positions[:k]
+        ins = int(np.searchsorted(ages, age, side='left'))
+        # Widen the window to whole tie groups at both edges so every row that
+        # could rank in the top k is a candidate.
+        lo_age = ages[max(ins - k, 0)]
+        hi_age = ages[min(ins + k, n_valid) - 1]
+        lo = int(np.searchsorted(ages, lo_age, side='left'))
+        hi = int(np.searchsorted(ages, hi_age, side='right'))
+        cand = positions[lo:hi]
+        diff = np.abs(ages[lo:hi] - age)
+        picked = cand[np.lexsort((cand, diff))][:k]
+        if len(picked) < k:
+            picked = np.concatenate([picked, positions[n_valid:][:k - len(picked)]])
+        return picked
+
+
+class ProfileIndex:
+    """Profile suggestions bucketed by (preference, gender, activity, disease).
+
+    Built once from the suggestions CSV so /plan can answer "closest rows by
+    age" with a binary search instead of copying and filtering the frame.
+    Suggestion texts are kept per column as StringArrays, read only for the
+    rows a lookup returns.
+    """
+
+    def __init__(self, df=None, diseases=KNOWN_DISEASES, arrays=None):
+        if arrays is None:
+            arrays = self.index_arrays(df)
+        self.columns = [str(c) for c in arrays['columns']]
+        self.has_snack = 'Snack Suggestion' in self.columns
+        # Suggestion strings for every row, in file order
+        self._suggestions = {c: StringArray.from_arrays(arrays, f'suggestion{i}')
+                             for i, c in enumerate(SUGGESTION_COLS) if c in self.columns}
+        self.size = len(arrays['pref'])
+        self._ages = arrays.get('ages')
+
+        pref = arrays['pref']
+        gender = arrays.get('gender')
+        activity = arrays.get('activity')
+        self._disease = arrays.get('disease')
+
+        # Group row positions by (pref, gender, activity); activity None means
+        # "any activity" for requests that leave the field empty.
+        keys = pd.DataFrame({
+            'pref': pref,
+            'gender': gender if gender is not None else '',
+            'activity': activity if activity is not None else '',
+        })
+        self._groups = {}
+        for by, with_activity in ((['pref', 'gender', 'activity'], True), (['pref', 'gender'], False)):
+            for key, idx in keys.groupby(by, sort=False).indices.items():
+                if not with_activity:
+                    key = tuple(key) + (None,)
+                self._groups[tuple(key)] = np.sort(idx)
+
+        self._buckets = {}
+        for key, idx in self._groups.items():
+            self._buckets[key + (None,)] = self._bucket(idx)
+            for d in diseases:
+                sub = self._filter_disease(idx, d)
+                self._buckets[key + (d.lower(),)] = self._bucket(sub)
+
+    @staticmethod
+    def index_arrays(df):
+        """Lower-cased grouping columns, ages and packed suggestion strings of every row"""
+        arrays = {
+            'columns': np.array([str(c) for c in df.columns], dtype=str),
+            'pref': np.char.lower(_text(df['Dietary Preference']).astype(str)),
+        }
+        for i, c in enumerate(SUGGESTION_COLS):
+            if c in df.columns:
+                arrays.update(StringArray.pack(_text(df[c])).arrays(f'suggestion{i}'))
+        age_col = 'Ages' if 'Ages' in df.columns else 'Age' if 'Age' in df.columns else None
+        if age_col:
+            arrays['ages'] = pd.to_numeric(df[age_col], errors='coerce').to_numpy(dtype=float)
+        for key, col in (('gender', 'Gender'), ('activity', 'Activity Level'), ('disease', 'Disease')):
+            if col in df.columns:
+                arrays[key] = np.char.lower(_text(df[col]).astype(str))
+        return arrays
+
+    def __len__(self):
+        return self.size
+
+    def record(self, i):
+        """Suggestion strings of row i, keyed by column"""
+        return {c: texts[i] for c, texts in self._suggestions.items()}
+
+    def _bucket(self, positions):
+        ages = self._ages[positions] if self._ages is not None else np.full(len(positions), np.nan)
+        return _Bucket(positions, ages)
+
+    def _filter_disease(self, positions, disease):
+        if self._disease is None:
+            return positions
+        hit = np.char.find(self._disease[positions], disease.lower()) >= 0
+        return positions[hit]
+
+    def lookup(self, pref_key, gender, activity_level, disease, age, k=14, exclude=None):
+        """Suggestion records of the k best matching rows (empty if none match).
+
+        exclude, if given, is a boolean array over all rows (e.g. an allergen
+        mask) marking rows that must not be picked.
+        """
+        g = gender.lower() if self._has('Gender') else ''
+        a = activity_level.lower() if (activity_level and self._has('Activity Level')) else None
+        base = (pref_key, g, a)
+        if base not in self._groups:
+            return []
+        d = disease.lower() if (disease and disease != 'None' and self._disease is not None) else None
+        bucket = self._buckets.get(base + (d,))
+        if bucket is None:
+            # Free-text disease outside the prebuilt set: filter this group only
+            bucket = self._bucket(self._filter_disease(self._groups[base], d))
+        if not len(bucket):
+            return []
+        picked = bucket.nearest(age if self._ages is not None else None, k, exclude)
+        return [self.record(i) for i in picked]
+
+    def _has(self, col):
+        return col in self.columns
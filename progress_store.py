@@ -0,0 +1,167 @@
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+
+from batching import MicroBatcher
+
+# One database shared by every worker process; WAL lets readers run alongside the writer
+PROGRESS_DB = os.getenv('PROGRESS_DB', 'progress.db')
+
+PERIODS = ('week', 'month')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    user TEXT NOT NULL,
+    day TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    value REAL,
+    meal TEXT,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_user_day ON entries (user, day);
+CREATE TABLE IF NOT EXISTS trends (
+    user TEXT NOT NULL,
+    period TEXT NOT NULL,
+    start TEXT NOT NULL,
+    weight_sum REAL NOT NULL DEFAULT 0,
+    weight_n INTEGER NOT NULL DEFAULT 0,
+    adherence_sum REAL NOT NULL DEFAULT 0,
+    adherence_n INTEGER NOT NULL DEFAULT 0,
+    meals INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (user, period, start)
+);
+'''
+
+UPSERT_TREND = '''
+INSERT INTO trends (user, period, start, weight_sum, weight_n, adherence_sum, adherence_n, meals)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (user, period, start) DO UPDATE SET
+    weight_sum = weight_sum + excluded.weight_sum,
+    weight_n = weight_n + excluded.weight_n,
+    adherence_sum = adherence_sum + excluded.adherence_sum,
+    adherence_n = adherence_n + excluded.adherence_n,
+    meals = meals + excluded.meals
+'''
+
+
+def period_start(day, period):
+    """First day of the ISO week (Monday) or month containing day"""
+    if period == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def to_rows(user, entry, created=None):
+    """Entry rows for one day's record {'day', 'weight', 'adherence', 'meals'}"""
+    day = entry.get('day') or date.today()
+    day = day if isinstance(day, date) else date.fromisoformat(str(day))
+    created = created or time.time()
+    rows = []
+    if entry.get('weight') is not None:
+        rows.append((user, day.isoformat(), 'weight', float(entry['weight']), None, created))
+    if entry.get('adherence') is not None:
+        rows.append((user, day.isoformat(), 'adherence', float(entry['adherence']), None, created))
+    for meal in entry.get('meals') or []:
+        rows.append((user, day.isoformat(), 'meal', None, str(meal), created))
+    return rows
+
+
+class ProgressStore:
+    """Append-only progress log in SQLite (WAL) with incrementally maintained trends.
+
+    Every insert also folds its values into the weekly and monthly rows of the
+    trends table inside the same transaction, so trend queries read a handful
+    of precomputed rows instead of a user's whole history.
+    """
+
+    def __init__(self, path=PROGRESS_DB, timeout=10.0):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def append(self, rows):
+        """Insert entry rows and update their trends in one transaction"""
+        if not rows:
+            return 0
+        deltas = {}
+        for user, day, kind, value, meal, created in rows:
+            for period in PERIODS:
+                key = (user, period, period_start(date.fromisoformat(day), period).isoformat())
+                delta = deltas.setdefault(key, [0.0, 0, 0.0, 0, 0])
+                if kind == 'weight':
+                    delta[0] += value
+                    delta[1] += 1
+                elif kind == 'adherence':
+                    delta[2] += value
+                    delta[3] += 1
+                else:
+                    delta[4] += 1
+        conn = self._connect()
+        with conn:
+            conn.executemany('INSERT INTO entries (user, day, kind, value, meal, created) VALUES (?, ?, ?, ?, ?, ?)', rows)
+            conn.executemany(UPSERT_TREND, [key + tuple(delta) for key, delta in deltas.items()])
+        return len(rows)
+
+    def history(self, user, start=None, end=None, kind=None):
+        """Entries of a user between two ISO days (inclusive), oldest first"""
+        query = 'SELECT day, kind, value, meal FROM entries WHERE user = ? AND day >= ? AND day <= ?'
+        params = [user, start or '0000-01-01', end or '9999-12-31']
+        if kind:
+            query += ' AND kind = ?'
+            params.append(kind)
+        rows = self._connect().execute(query + ' ORDER BY day, id', params).fetchall()
+        return [{k: r[k] for k in ('day', 'kind', 'value', 'meal') if r[k] is not None} for r in rows]
+
+    def trends(self, user, period='week', limit=12):
+        """Most recent weekly or monthly aggregates, oldest first"""
+        rows = self._connect().execute(
+            'SELECT * FROM trends WHERE user = ? AND period = ? ORDER BY start DESC LIMIT ?',
+            (user, period, limit)).fetchall()
+        return [{
+            'start': r['start'],
+            'avg_weight': r['weight_sum'] / r['weight_n'] if r['weight_n'] else None,
+            'avg_adherence': r['adherence_sum'] / r['adherence_n'] if r['adherence_n'] else None,
+            'meals': r['meals'],
+        } for r in reversed(rows)]
+
+    def close(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class BatchWriter(MicroBatcher):
+    """Group commit for request handlers: rows written within `delay` seconds of
+    each other share one transaction, run off the event loop.
+    """
+
+    def __init__(self, store, delay=0.02, max_rows=1000):
+        super().__init__(delay, max_rows)
+        self.store = store
+
+    async def write(self, rows):
+        """Queue rows and wait until the batch holding them is committed"""
+        if not rows:
+            return 0
+        await self.submit(rows)
+        return len(rows)
+
+    def process(self, rows):
+        self.store.append(rows)
+        return [None] * len(rows)
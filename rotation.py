@@ -0,0 +1,63 @@
+import random
+from collections import deque
+
+from plan_engine import day_label
+
+# Plan lengths accepted as plan_type, besides a plain number of days
+PLAN_LENGTHS = {'daily': 1, 'weekly': 7, 'monthly': 30, 'quarterly': 90, 'yearly': 365}
+
+MAX_PLAN_DAYS = 366
+
+# A dish is not offered again in the same meal slot within this many days
+NO_REPEAT_DAYS = 7
+
+
+def plan_length(plan_type, default=7):
+    """Number of days for a plan_type ('Weekly', 'Monthly', '90', ...), capped at MAX_PLAN_DAYS"""
+    key = str(plan_type or '').strip().lower()
+    days = int(key) if key.isdigit() else PLAN_LENGTHS.get(key, default)
+    return max(1, min(days, MAX_PLAN_DAYS))
+
+
+class Rotation:
+    """Draws the dishes of one meal slot so that none repeats within `window` days.
+
+    Dishes are either ready or cooling down: a drawn dish is swapped out of
+    the ready list and queued until its window has passed, so every draw is
+    O(1) however long the plan is. With fewer dishes than the window allows,
+    the one that has cooled down longest is released early.
+    """
+
+    def __init__(self, options, window=NO_REPEAT_DAYS, rng=None):
+        self.ready = list(dict.fromkeys(options))
+        self.cooling = deque()
+        self.window = window
+        self.rng = rng or random.Random()
+
+    def draw(self, day):
+        while self.cooling and self.cooling[0][0] <= day:
+            self.ready.append(self.cooling.popleft()[1])
+        if not self.ready:
+            if not self.cooling:
+                return None
+            self.ready.append(self.cooling.popleft()[1])
+        i = self.rng.randrange(len(self.ready))
+        self.ready[i], self.ready[-1] = self.ready[-1], self.ready[i]
+        dish = self.ready.pop()
+        self.cooling.append((day + self.window, dish))
+        return dish
+
+
+def rotate(options, days, window=NO_REPEAT_DAYS, seed=None, missing='N/A'):
+    """Plan rows {'day', meal: dish, ...} for `days` days, one at a time.
+
+    options maps each meal to the dishes it may draw from; the same seed
+    gives the same plan.
+    """
+    rng = random.Random(seed)
+    slots = {meal: Rotation(dishes, window, rng) for meal, dishes in options.items()}
+    for d in range(days):
+        row = {'day': day_label(d, days)}
+        for meal, slot in slots.items():
+            row[meal] = slot.draw(d) or missing
+        yield row
@@ -0,0 +1,35 @@
+"""Run the API under several uvicorn workers that share one copy of the data.
+
+The parent imports main once, which builds the columnar dataset caches and
+the memory-mapped indexes under .shared/; each worker then maps the same
+files read-only instead of parsing and indexing its own copy.
+
+With --lazy the workers bind straight away and load the data in the
+background (see /readyz); the parent skips its warm-up.
+
+    python serve.py --workers 4 [--host 0.0.0.0] [--port 8000] [--lazy]
+"""
+import argparse
+import os
+
+import uvicorn
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--lazy', action='store_true', help='bind first, load the data in the background')
+    args = parser.parse_args()
+
+    if args.lazy:
+        os.environ['LAZY_STARTUP'] = '1'
+    else:
+        # Build (or validate) every shared file before the workers start
+        import main as app_module  # noqa: F401
+    uvicorn.run('main:app', host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# Derived indexes shared by every worker, one directory of .npy files per index
+SHARED_DIR = os.getenv('SHARED_INDEX_DIR', '.shared')
+
+# SHARED_INDEXES=0 keeps every index in private memory (for comparisons)
+ENABLED = os.getenv('SHARED_INDEXES', '1') != '0'
+
+# Bump when an index's array layout changes so old files are rebuilt
+SHARED_VERSION = 1
+
+
+class StringArray:
+    """Read-only list of strings stored as UTF-8 bytes plus offsets.
+
+    Both arrays can be memory-mapped, so thousands of names cost two shared
+    buffers instead of one Python object each per process.
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def pack(cls, strings):
+        encoded = [str(s).encode() for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return cls(np.frombuffer(b''.join(encoded), dtype=np.uint8), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        if np.ndim(i) == 0:
+            return self.data[self.offsets[i]:self.offsets[i + 1]].tobytes().decode()
+        return np.array([self[j] for j in np.asarray(i).ravel()], dtype=object).reshape(np.shape(i))
+
+    def __iter__(self):
+        return (self[i] for i in range(len(self)))
+
+    def arrays(self, prefix):
+        return {f'{prefix}_data': self.data, f'{prefix}_offsets': self.offsets}
+
+    @classmethod
+    def from_arrays(cls, arrays, prefix):
+        return cls(arrays[f'{prefix}_data'], arrays[f'{prefix}_offsets'])
+
+
+def _plain(value):
+    """JSON form of the sets and arrays found in index parameters, independent of their order"""
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return str(value)
+
+
+def source_key(name, sources, **params):
+    """Directory name for an index from its name, parameters and source files' size/mtime.
+
+    params carry everything besides the sources that the arrays depend on
+    (tables such as allergen synonyms, limits, versions), so changing one
+    of them rebuilds the index.
+    """
+    stats = []
+    for path in sources:
+        st = os.stat(path)
+        stats.append([os.path.abspath(path), st.st_size, st.st_mtime_ns])
+    spec = json.dumps({'version': SHARED_VERSION, 'sources': stats, **params}, sort_keys=True, default=_plain)
+    return f'{name}-' + hashlib.blake2b(spec.encode(), digest_size=12).hexdigest()
+
+
+def _attach(target):
+    return {f[:-4]: np.load(os.path.join(target, f), mmap_mode='r').view(np.ndarray)
+            for f in os.listdir(target) if f.endswith('.npy')}
+
+
+def shared_arrays(name, sources, build, shared_dir=None, **params):
+    """Arrays of a derived index, memory-mapped from disk so workers share one copy.
+
+    build is usually an index class's index_arrays(); the result goes to that
+    class's arrays= argument, which takes the dict built in memory or the
+    read-only mapped one alike. The first process to get here calls build()
+    under a file lock and writes the result; every other process, and later
+    starts, attach read-only. Falls back to the built arrays when the
+    directory is not writable.
+    """
+    if not ENABLED:
+        return build()
+    shared_dir = shared_dir or SHARED_DIR
+    try:
+        target = os.path.join(shared_dir, source_key(name, sources, **params))
+    except OSError:
+        return build()
+    if os.path.isdir(target):
+        return _attach(target)
+    try:
+        os.makedirs(shared_dir, exist_ok=True)
+        lock = open(os.path.join(shared_dir, f'.{name}.lock'), 'w')
+    except OSError:
+        return build()
+    with lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if os.path.isdir(target):
+            return _attach(target)
+        arrays = build()
+        tmp = tempfile.mkdtemp(prefix=f'.{name}.', dir=shared_dir)
+        try:
+            for key, value in arrays.items():
+                np.save(os.path.join(tmp, f'{key}.npy'), np.require(value, requirements='C'))
+            os.chmod(tmp, 0o755)
+            os.replace(tmp, target)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+            return arrays
+        # Drop older versions of this index
+        for entry in os.listdir(shared_dir):
+            if entry.startswith(f'{name}-') and entry != os.path.basename(target):
+                shutil.rmtree(os.path.join(shared_dir, entry), ignore_errors=True)
+    return _attach(target)
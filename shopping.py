@@ -0,0 +1,57 @@
+from collections import Counter
+
+import numpy as np
+
+from plan_engine import NUTRIENTS
+
+
+class ShoppingList:
+    """Consolidated shopping lists over INDB household servings.
+
+    Plans come in as arrays of food rows and servings (PlanEngine.choose),
+    so a week or a household's month is summed with one bincount and the
+    nutrient totals with one matrix product, whatever the number of dishes.
+    Dish names are resolved through the same dish -> INDB table as the
+    plan's per-meal nutrition (MealLinks), one serving of each part.
+    """
+
+    def __init__(self, engine, links=None):
+        self.engine = engine
+        self.links = links
+
+    def consolidate(self, picks):
+        """Total servings and nutrients per food over a list of (rows, servings) arrays"""
+        size = len(self.engine.names)
+        rows = np.concatenate([np.ravel(r) for r, _ in picks] + [np.empty(0, dtype=np.int64)]).astype(np.int64)
+        servings = np.concatenate([np.ravel(s) for _, s in picks] + [np.empty(0)])
+        total = np.bincount(rows, weights=servings, minlength=size)
+        foods = np.flatnonzero(total)
+        foods = foods[np.lexsort((self.engine.names[foods], -total[foods]))]
+        nutrients = self.engine.per_serving[foods] * total[foods, None]
+        items = [{
+            'food_code': self.engine.codes[i],
+            'food_name': self.engine.names[i],
+            'servings': float(total[i]),
+            'servings_unit': self.engine.units[i],
+            **{c: round(float(v), 1) for c, v in zip(NUTRIENTS, nut)},
+        } for i, nut in zip(foods, nutrients)]
+        return {'items': items, 'totals': {c: round(float(v), 1) for c, v in zip(NUTRIENTS, nutrients.sum(axis=0))}}
+
+    def from_dishes(self, dishes, servings=1.0):
+        """Shopping list for dish names, one serving per occurrence; unmatched names are listed apart"""
+        return self.from_counts(Counter(dishes), servings)
+
+    def from_counts(self, counts, servings=1.0):
+        """Shopping list for {dish name: occurrences}, e.g. a long plan's running tally"""
+        counts = {d: n for d, n in counts.items() if d and d != 'N/A'}
+        dishes = list(counts)
+        if self.links is not None and dishes:
+            owner, rows = self.links.parts(dishes)
+        else:
+            owner, rows = np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        occurrences = np.array([counts[d] for d in dishes], dtype=float)
+        result = self.consolidate([(rows, occurrences[owner] * float(servings))])
+        found = np.zeros(len(dishes), dtype=bool)
+        found[owner] = True
+        result['unresolved'] = sorted(d for d, ok in zip(dishes, found) if not ok)
+        return result
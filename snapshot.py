@@ -0,0 +1,240 @@
+import glob
+import os
+import threading
+import time
+
+import pandas as pd
+
+from allergens import DIET_EXCLUDES, SYNONYMS, AllergenIndex
+from datasets import load_csv, read_header
+from diet_model import DATA_PATH as CLINICAL_PATH, MIN_ACCURACY, BatchPredictor, diet_model_for
+from food_search import FoodSearch
+from meal_links import CANDIDATES, LINKS_VERSION, MIN_PRECISION, STOPWORDS, MealLinks
+from plan_engine import MAX_SERVING_KCAL, MIN_SERVING_KCAL, NUTRIENTS, PlanEngine
+from profile_index import SUGGESTION_COLS, ProfileIndex
+from shared import shared_arrays
+from shopping import ShoppingList
+from substitutes import FEATURES, TOP_K, SubstituteIndex
+
+DIET_PATH = "INDB.csv"
+
+# Tables the allergen indexes are built from; part of their shared_arrays key
+ALLERGEN_PARAMS = {'synonyms': SYNONYMS, 'diet_excludes': DIET_EXCLUDES}
+
+PROFILE_CANDIDATES = [
+    "Food_and_Nutrition__.csv",  # your uploaded file
+    "profile_meal_suggestions.csv",
+    "meal_suggestions.csv",
+    "dietary_profile_suggestions.csv",
+    "meal_recommendations.csv",
+]
+
+PROFILE_COLUMNS = ['Dietary Preference', 'Breakfast Suggestion', 'Lunch Suggestion', 'Dinner Suggestion']
+
+
+def source_stamps(paths):
+    """(size, mtime) of each path, None for missing files"""
+    stamps = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+            stamps.append((st.st_size, st.st_mtime_ns))
+        except OSError:
+            stamps.append(None)
+    return tuple(stamps)
+
+
+def find_profile_dataset(warnings):
+    """The profile suggestions dataset, its path and, when it was found by its
+    columns rather than its name, its stamp taken before reading; or an empty frame"""
+    for fname in PROFILE_CANDIDATES:
+        if os.path.exists(fname):
+            try:
+                return load_csv(fname), fname, None
+            except Exception as exc:
+                warnings.append(f"{fname}: {exc}")
+    # Generic auto-discovery: pick any CSV with required suggestion columns,
+    # checking headers only and loading just the file that matches
+    for path in glob.glob("*.csv"):
+        try:
+            if set(PROFILE_COLUMNS).issubset(read_header(path)):
+                stamp = source_stamps([path])
+                return load_csv(path), path, stamp
+        except Exception:
+            continue
+    return pd.DataFrame(), None, None
+
+
+class DataSnapshot:
+    """The datasets and every index derived from them, built as one unit.
+
+    A snapshot is never modified once built: a reload builds a new one to
+    the side and publishes it by swapping a single reference, and handlers
+    read that reference once per request, so a request finishes on the data
+    it started with and nothing needs a lock.
+    """
+
+    def __init__(self):
+        self.diet_path = None
+        self.diet_df = pd.DataFrame()
+        self.profile_df = pd.DataFrame()
+        self.profile_path = None
+        self.profile_index = None
+        self.profile_allergens = None
+        self.plan_engine = None
+        self.food_allergens = None
+        self.food_search = None
+        self.shopping = None
+        self.meal_links = None
+        self.substitutes = None
+        self.diet_model = None
+        self.diet_batcher = None
+        self.errors = []
+        self.warnings = []
+        self.watched = ()
+        self.stamps = ()
+        self.loaded_at = None
+        self.seconds = None
+
+    @classmethod
+    def load(cls, diet_path=DIET_PATH, extra_dishes=()):
+        """Load the datasets (through the columnar cache next to each CSV) and build their indexes.
+
+        Derived indexes are built once into memory-mapped files (see shared.py),
+        so every uvicorn worker attaches to the same pages instead of holding a
+        copy. extra_dishes are dish names besides the profile suggestions to
+        link to INDB foods. Problems are recorded in errors/warnings rather
+        than raised.
+        """
+        snap = cls()
+        snap.diet_path = diet_path
+        start = time.perf_counter()
+        # Stamped before reading, so a change made while loading triggers another reload
+        snap.watched = (diet_path, *PROFILE_CANDIDATES, CLINICAL_PATH)
+        snap.stamps = source_stamps(snap.watched)
+        errors, warnings = snap.errors, snap.warnings
+        try:
+            try:
+                diet_df = snap.diet_df = load_csv(diet_path)
+            except Exception as exc:
+                diet_df = pd.DataFrame()
+                errors.append(f"{diet_path}: {exc}")
+            for col in ('food_name', 'energy_kcal'):
+                if not diet_df.empty and col not in diet_df.columns:
+                    errors.append(f"{diet_path}: missing '{col}' column")
+
+            # Optionally load a profile-based suggestions dataset if present
+            profile_df, profile_path, stamp = find_profile_dataset(warnings)
+            snap.profile_df, snap.profile_path = profile_df, profile_path
+            if stamp is not None:
+                # A discovered file is not among the watched names: watch it too
+                snap.watched += (profile_path,)
+                snap.stamps += stamp
+
+            # Bucketed, age-sorted index over the profile suggestions
+            if not profile_df.empty and all(col in profile_df.columns for col in PROFILE_COLUMNS):
+                index = snap.profile_index = ProfileIndex(arrays=shared_arrays(
+                    'profile_index', [profile_path], lambda: ProfileIndex.index_arrays(profile_df),
+                    columns=SUGGESTION_COLS))
+                # Allergen index over each row's suggestions, tokenized once
+                snap.profile_allergens = AllergenIndex(arrays=shared_arrays('profile_allergens', [profile_path], lambda: AllergenIndex.index_arrays(
+                    ' | '.join(index.record(i).values()) for i in range(len(index))), **ALLERGEN_PARAMS))
+            elif not profile_df.empty:
+                warnings.append(f"{profile_path}: missing suggestion columns")
+
+            # Nutrient-targeted plan engine over the INDB servings
+            if {'food_name', 'energy_kcal'}.issubset(diet_df.columns):
+                snap.plan_engine = PlanEngine(arrays=shared_arrays(
+                    'plan_engine', [diet_path], lambda: PlanEngine.index_arrays(diet_df),
+                    nutrients=NUTRIENTS, serving_kcal=[MIN_SERVING_KCAL, MAX_SERVING_KCAL]))
+
+            if 'food_name' in diet_df.columns:
+                # Allergen index over the INDB food names, shared by the plan engine
+                snap.food_allergens = AllergenIndex(arrays=shared_arrays(
+                    'food_allergens', [diet_path], lambda: AllergenIndex.index_arrays(diet_df['food_name']),
+                    **ALLERGEN_PARAMS))
+                # Prefix/trigram index over the INDB food names and codes for /foods/search
+                snap.food_search = FoodSearch(diet_df, arrays=shared_arrays('food_search', [diet_path], lambda: FoodSearch.index_arrays(diet_df)))
+
+            # Nutritionally closest foods per INDB food for /foods/{food_code}/substitutes
+            if snap.food_search is not None and 'energy_kcal' in diet_df.columns:
+                snap.substitutes = SubstituteIndex(arrays=shared_arrays(
+                    'substitutes', [diet_path], lambda: SubstituteIndex.index_arrays(diet_df), k=TOP_K,
+                    features=FEATURES))
+
+            if snap.plan_engine is not None:
+                # Suggested dish names linked to INDB foods, for per-meal nutrition in /plan
+                snap.meal_links = cls.link_dishes(snap, diet_path, extra_dishes)
+                # Shopping lists in INDB household servings, resolving dishes through the same links
+                snap.shopping = ShoppingList(snap.plan_engine, snap.meal_links)
+        except Exception as exc:
+            errors.append(f"indexing failed: {exc!r}")
+
+        # Diet type classifier over the clinical dataset, served through a micro-batching
+        # queue when it is accurate enough to beat the disease table
+        if os.path.exists(CLINICAL_PATH):
+            try:
+                model = diet_model_for(CLINICAL_PATH)
+                if model.serves():
+                    snap.diet_model = model
+                    snap.diet_batcher = BatchPredictor(model)
+                else:
+                    warnings.append(f"{CLINICAL_PATH}: diet model cross-validated accuracy "
+                                    f"{model.meta['cv_accuracy']} is below {MIN_ACCURACY}, using disease_map")
+            except Exception as exc:
+                warnings.append(f"{CLINICAL_PATH}: {exc}")
+        snap.loaded_at = time.time()
+        snap.seconds = round(time.perf_counter() - start, 3)
+        return snap
+
+    @staticmethod
+    def link_dishes(snap, diet_path, extra_dishes):
+        """Dish name -> INDB foods table over every suggestion and curated dish"""
+        extra = sorted(set(extra_dishes))
+        sources = [diet_path]
+        dishes = list(extra)
+        if snap.profile_index is not None:
+            sources.append(snap.profile_path)
+            columns = [c for c in snap.profile_df.columns if c.endswith('Suggestion')]
+            dishes.extend(pd.unique(snap.profile_df[columns].to_numpy().ravel()))
+        engine, search = snap.plan_engine, snap.food_search
+        return MealLinks(engine, search, arrays=shared_arrays(
+            'meal_links', sources, lambda: MealLinks.index_arrays(dishes, engine, search),
+            extra=extra, version=LINKS_VERSION, stopwords=STOPWORDS, candidates=CANDIDATES,
+            min_precision=MIN_PRECISION, nutrients=NUTRIENTS))
+
+
+class SourceWatcher(threading.Thread):
+    """Polls the current snapshot's source files and calls reload() once a change has settled.
+
+    A change is acted on when two polls in a row see the same new stamps, so
+    a CSV that is still being written is not loaded half-way. reload()
+    returns False when the new data was rejected; those stamps are then not
+    retried until the files change again.
+    """
+
+    def __init__(self, current, reload, interval=5.0):
+        super().__init__(name='data-watcher', daemon=True)
+        self.current = current
+        self.reload = reload
+        self.interval = interval
+        self.stopped = threading.Event()
+
+    def run(self):
+        pending = rejected = None
+        while not self.stopped.wait(self.interval):
+            snap = self.current()
+            stamps = source_stamps(snap.watched)
+            if stamps == snap.stamps or stamps == rejected:
+                pending = None
+            elif stamps != pending:
+                pending = stamps
+            else:
+                pending = None
+                try:
+                    rejected = None if self.reload() else stamps
+                except Exception:
+                    rejected = stamps
+
+    def stop(self):
+        self.stopped.set()
@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Per-100 g nutrients two foods are compared on, with their weight in the distance
+FEATURES = {
+    'energy_kcal': 2.0, 'carb_g': 1.0, 'protein_g': 1.0, 'fat_g': 1.0, 'fibre_g': 1.0,
+    'freesugar_g': 1.0, 'sodium_mg': 1.0,
+    'vita_ug': 0.5, 'vitc_mg': 0.5, 'vite_mg': 0.5, 'folate_ug': 0.5, 'vitb1_mg': 0.5,
+    'vitb2_mg': 0.5, 'vitb3_mg': 0.5, 'vitb6_mg': 0.5,
+}
+
+# Neighbours stored per food; queries filter these, so it bounds k after filtering
+TOP_K = 50
+
+# Threads for the one-off neighbour build (-1 = every core)
+BUILD_JOBS = int(os.getenv('SUBSTITUTE_BUILD_JOBS', '-1'))
+
+
+def standardize(df, features=FEATURES):
+    """Weighted z-scores of log-scaled nutrients, one row per food.
+
+    log1p tames the long tails (sodium in soups, vitamin A in greens) that
+    would otherwise decide every distance; missing values count as zero.
+    """
+    columns = [c for c in features if c in df.columns]
+    X = df[columns].apply(pd.to_numeric, errors='coerce').fillna(0).clip(lower=0).to_numpy(dtype=float)
+    X = np.log1p(X)
+    scale = X.std(axis=0)
+    scale[scale == 0] = 1.0
+    return (X - X.mean(axis=0)) / scale * np.array([features[c] for c in columns])
+
+
+class SubstituteIndex:
+    """Nutritionally closest foods for each INDB food, precomputed.
+
+    Every food's top-k neighbours are found once with a KD-tree over the
+    standardized nutrient vectors and stored as an (n x k) array, so a
+    lookup is one row slice, filtered by diet preference and allergens at
+    query time. scikit-learn is only needed to build the table.
+    """
+
+    def __init__(self, df=None, k=TOP_K, arrays=None):
+        if arrays is None:
+            arrays = self.index_arrays(df, k)
+        self.neighbours = arrays['neighbours']
+        self.distances = arrays['distances']
+        self.size = len(self.neighbours)
+
+    @staticmethod
+    def index_arrays(df, k=TOP_K):
+        """Neighbour rows (nearest first, self excluded) and their distances per food"""
+        Z = standardize(df)
+        n = len(Z)
+        k = max(0, min(k, n - 1))
+        if not k:
+            return {'neighbours': np.empty((n, 0), dtype=np.int32), 'distances': np.empty((n, 0), dtype=np.float32)}
+        from sklearn.neighbors import NearestNeighbors  # only needed to build; slow to import
+        tree = NearestNeighbors(n_neighbors=k + 1, algorithm='kd_tree', n_jobs=BUILD_JOBS).fit(Z)
+        dist, idx = tree.kneighbors(Z)
+        # Drop each food from its own list; with exact duplicates it may not
+        # come first, and if it is missing altogether the farthest one goes
+        own = idx == np.arange(n)[:, None]
+        own[~own.any(axis=1), -1] = True
+        keep = ~own
+        return {
+            'neighbours': idx[keep].reshape(n, k).astype(np.int32),
+            'distances': dist[keep].reshape(n, k).astype(np.float32),
+        }
+
+    def __len__(self):
+        return self.size
+
+    def lookup(self, row, k=10, exclude=None):
+        """Rows and distances of the k closest foods to a row, skipping rows where exclude is True"""
+        rows, dist = self.neighbours[row], self.distances[row]
+        if exclude is not None:
+            keep = ~exclude[rows]
+            rows, dist = rows[keep], dist[keep]
+        return rows[:k], dist[:k]
@@ -0,0 +1,44 @@
+import asyncio
+from types import SimpleNamespace
+
+import diet_model
+from diet_model import DietModel
+from main import disease_map, predict_diet, predict_diets
+
+DISEASES = ['Diabetes', 'Obesity', 'Hypertension', 'None', 'Unknown']
+EXPECTED = ['Low_Sugar', 'Low_Carb', 'Low_Sodium', 'Balanced', 'Balanced']
+
+
+class FailingModel:
+    def predict(self, rows):
+        raise RuntimeError('broken model')
+
+
+def test_disease_map():
+    assert disease_map == {'None': 'Balanced', 'Diabetes': 'Low_Sugar', 'Hypertension': 'Low_Sodium',
+                           'Obesity': 'Low_Carb'}
+
+
+def test_predict_diets_without_model():
+    snap = SimpleNamespace(diet_model=None)
+    assert predict_diets(snap, [{}] * len(DISEASES), DISEASES) == EXPECTED
+
+
+def test_predict_diets_when_model_fails():
+    snap = SimpleNamespace(diet_model=FailingModel())
+    assert predict_diets(snap, [{}] * len(DISEASES), DISEASES) == EXPECTED
+
+
+def test_predict_diet_without_batcher():
+    snap = SimpleNamespace(diet_batcher=None)
+    assert [asyncio.run(predict_diet(snap, {}, d)) for d in DISEASES] == EXPECTED
+
+
+def test_model_served_only_when_accurate(monkeypatch):
+    monkeypatch.setattr(diet_model, 'MIN_ACCURACY', 0.6)
+    model = DietModel()
+    assert not model.serves()
+    model.meta = {'cv_accuracy': 0.41}
+    assert not model.serves()
+    model.meta = {'cv_accuracy': 0.82}
+    assert model.serves()
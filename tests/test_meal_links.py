@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+
+import pandas as pd
+import pytest
+
+from food_search import FoodSearch
+from meal_links import food_names, match_part, resolve
+
+# INDB names in their own spelling, aliases and qualifiers included
+NAMES = [
+    'Chapati/Roti',
+    'Soya roti',
+    'Potato with curd',
+    'Boiled rice (Uble chawal)',
+    'Spanish rice',
+    'Stewed fruit (with pear)',
+    'Fruit salad (Phalon ka salaad)',
+    'Plain parantha/paratha',
+    'Curd rice (Dahi bhaat/Dahi chawal/ Perugu annam/Daddojanam)',
+    'Mayonnaise without eggs',
+    'Boiled egg (Ubla anda)',
+    'Fried Egg ',
+    'Mixed dal',
+    'Dalma',
+    'Vegetable upma',
+    'Bread upma',
+    'Lassi (salted)',
+    'Stuffed baked potatoes ',
+]
+
+
+@pytest.fixture(scope='module')
+def index():
+    df = pd.DataFrame({'food_name': NAMES, 'food_code': [f'F{i:03d}' for i in range(len(NAMES))]})
+    return SimpleNamespace(names=NAMES), FoodSearch(df)
+
+
+def matched(part, index):
+    row = match_part(part, *index)
+    return NAMES[row] if row >= 0 else None
+
+
+@pytest.mark.parametrize('part, name', [
+    ('roti', 'Chapati/Roti'),
+    ('Chapati', 'Chapati/Roti'),
+    ('soya roti', 'Soya roti'),
+    ('rice', 'Boiled rice (Uble chawal)'),
+    ('steamed rice', 'Boiled rice (Uble chawal)'),
+    ('paratha', 'Plain parantha/paratha'),
+    ('Dahi chawal', 'Curd rice (Dahi bhaat/Dahi chawal/ Perugu annam/Daddojanam)'),
+    ('curd rice', 'Curd rice (Dahi bhaat/Dahi chawal/ Perugu annam/Daddojanam)'),
+    ('eggs', 'Boiled egg (Ubla anda)'),
+    ('Lassi', 'Lassi (salted)'),
+    ('potato with curd', 'Potato with curd'),
+    ('baked potato', 'Stuffed baked potatoes '),
+    ('Vegetable upma', 'Vegetable upma'),
+])
+def test_match(index, part, name):
+    assert matched(part, index) == name
+
+
+@pytest.mark.parametrize('part', [
+    'curd',         # only part of the compound "Potato with curd"
+    'fruit',        # "Stewed fruit" is a dish of its own
+    'dal',          # no plain dal; "Dalma" is another word
+    'Oats upma',    # no oats upma in INDB
+    'salad',
+    'with',
+])
+def test_unresolved(index, part):
+    assert matched(part, index) is None
+
+
+def test_food_names():
+    assert food_names('Chapati/Roti') == [([{'chapati', 'roti'}], False)]
+    # Lower-case brackets qualify the food, capitalised ones are other names
+    assert food_names('Lassi (salted)') == [([{'lassi'}], False)]
+    assert [len(slots) for slots, _ in food_names('Boiled rice (Uble chawal)')] == [1, 2]
+    assert food_names('Potato with curd')[0][1]
+
+
+def test_resolve_parts(index):
+    names, search = index
+    rows, complete = resolve('Vegetable upma with roti', names, search)
+    assert [NAMES[r] for r in rows] == ['Vegetable upma', 'Chapati/Roti']
+    assert complete
+    rows, complete = resolve('Greek yogurt with granola and fruit', names, search)
+    assert rows == [] and not complete
+    rows, complete = resolve('Oats upma with curd', names, search)
+    assert rows == [] and not complete
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import pytest
+
+import plan_workers
+from plan_workers import StaleSnapshot, _init_worker, _run_in_worker
+
+
+@pytest.fixture
+def disk(monkeypatch):
+    """Stamps of the data a worker would load now; loads are counted"""
+    for name in ('_worker_load', '_worker_snap', '_worker_stamps'):
+        monkeypatch.setattr(plan_workers, name, None)
+    state = SimpleNamespace(stamps='v1', loads=0)
+
+    def load():
+        state.loads += 1
+        return SimpleNamespace(stamps=state.stamps)
+
+    _init_worker(load)
+    return state
+
+
+def stamps_of(snap):
+    return snap.stamps
+
+
+def test_job_on_loaded_snapshot(disk):
+    assert _run_in_worker(stamps_of, 'v1', (), False) == ('v1', None)
+    assert disk.loads == 1
+
+
+def test_reload_keeps_loaded_stamps(disk):
+    disk.stamps = 'v2'
+    assert _run_in_worker(stamps_of, 'v2', (), False)[0] == 'v2'
+    assert plan_workers._worker_stamps == 'v2'
+    assert disk.loads == 2
+    # Already on v2: no further reload
+    _run_in_worker(stamps_of, 'v2', (), False)
+    assert disk.loads == 2
+
+
+def test_job_for_other_data_than_disk(disk):
+    # The parent still serves v2 while the files already changed to v3
+    disk.stamps = 'v3'
+    with pytest.raises(StaleSnapshot):
+        _run_in_worker(stamps_of, 'v2', (), False)
+    # The worker records what it really loaded, not the job's stamps
+    assert plan_workers._worker_stamps == 'v3'
+    assert _run_in_worker(stamps_of, 'v3', (), False)[0] == 'v3'
+    assert disk.loads == 2
@@ -0,0 +1,47 @@
+import random
+
+from rotation import Rotation, rotate
+
+
+def draws(options, days, window, seed=0):
+    slot = Rotation(options, window, random.Random(seed))
+    return [slot.draw(day) for day in range(days)]
+
+
+def test_no_repeat_within_window():
+    dishes = [f'dish {i}' for i in range(10)]
+    for seed in range(20):
+        picked = draws(dishes, 90, 7, seed)
+        for day, dish in enumerate(picked):
+            assert dish not in picked[max(0, day - 6):day]
+
+
+def test_every_dish_comes_back():
+    dishes = [f'dish {i}' for i in range(10)]
+    assert set(draws(dishes, 90, 7)) == set(dishes)
+
+
+def test_fewer_dishes_than_window_cycle():
+    # Too few dishes to keep the window: each is reused as late as possible
+    picked = draws(['a', 'b', 'c'], 30, 7)
+    for day in range(3, 30):
+        assert picked[day] == picked[day - 3]
+        assert picked[day] not in picked[day - 2:day]
+
+
+def test_duplicates_and_no_options():
+    assert set(draws(['a', 'a', 'b'], 10, 7)) == {'a', 'b'}
+    assert draws([], 3, 7) == [None, None, None]
+
+
+def test_rotate_rows():
+    options = {'Breakfast': ['x', 'y'], 'Lunch': []}
+    rows = list(rotate(options, 3, seed=1))
+    assert len(rows) == 3
+    assert all(row['Lunch'] == 'N/A' for row in rows)
+    assert all(row['Breakfast'] in ('x', 'y') for row in rows)
+
+
+def test_rotate_seed():
+    options = {'Breakfast': [f'b{i}' for i in range(12)], 'Dinner': [f'd{i}' for i in range(12)]}
+    assert list(rotate(options, 60, seed=5)) == list(rotate(options, 60, seed=5))
@@ -0,0 +1,87 @@
+import copy
+import hashlib
+import json
+import os
+
+from sklearn.decomposition import NMF, MiniBatchNMF
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+import artifacts
+from datasets import fingerprint
+
+# Fitted models shared by every session and process, one file per (data, params)
+MODEL_DIR = os.getenv('TOPIC_MODEL_DIR', '.topic_models')
+
+
+class TopicModel:
+    """TF-IDF + NMF food topics that can be persisted, updated and reused.
+
+    mode='batch' fits a regular NMF; mode='minibatch' uses MiniBatchNMF so new
+    data can be folded in with update() instead of refitting.
+    """
+
+    def __init__(self, n_topics=5, max_features=100, mode='batch', random_state=42):
+        self.params = {'n_topics': n_topics, 'max_features': max_features,
+                       'mode': mode, 'random_state': random_state}
+        self.vectorizer = None
+        self.nmf = None
+
+    def fit(self, texts):
+        self.vectorizer = TfidfVectorizer(stop_words='english', max_features=self.params['max_features'])
+        X = self.vectorizer.fit_transform(texts)
+        n_topics = min(self.params['n_topics'], X.shape[0])
+        if self.params['mode'] == 'minibatch':
+            self.nmf = MiniBatchNMF(n_components=n_topics, random_state=self.params['random_state'])
+        else:
+            self.nmf = NMF(n_components=n_topics, random_state=self.params['random_state'])
+        self.nmf.fit(X)
+        return self
+
+    def update(self, texts):
+        """Fold new documents into the topics with a mini-batch step (vocabulary stays fixed)"""
+        X = self.vectorizer.transform(texts)
+        if not isinstance(self.nmf, MiniBatchNMF):
+            # Continue from the batch solution
+            minibatch = MiniBatchNMF(n_components=self.nmf.n_components_, init='custom',
+                                     random_state=self.params['random_state'])
+            minibatch.partial_fit(X, W=self.nmf.transform(X), H=self.nmf.components_.copy())
+            self.nmf = minibatch
+            self.params['mode'] = 'minibatch'
+        else:
+            self.nmf.partial_fit(X)
+        return self
+
+    def transform(self, texts):
+        """Topic weights of new foods on the existing topics, without refitting"""
+        return self.nmf.transform(self.vectorizer.transform(texts))
+
+    def topics(self, n_terms=5):
+        """Top terms of each topic"""
+        feature_names = self.vectorizer.get_feature_names_out()
+        return [[feature_names[i] for i in topic.argsort()[:-n_terms - 1:-1]]
+                for topic in self.nmf.components_]
+
+
+def model_key(data_path, column, **params):
+    """Cache key from the dataset's content hash, the text column and the hyperparameters"""
+    spec = json.dumps({'data': fingerprint(data_path), 'column': column, **params}, sort_keys=True)
+    return hashlib.blake2b(spec.encode(), digest_size=16).hexdigest()
+
+
+def topic_model_for(data_path, column, texts, n_topics=5, max_features=100, mode='batch',
+                    random_state=42, base=None, model_dir=MODEL_DIR):
+    """The fitted model for this dataset and parameters, fitting only on a cache miss.
+
+    On a miss, a mini-batch base model (fitted on an earlier dataset with the
+    same parameters) is updated with `texts` instead of fitting from scratch.
+    """
+    params = {'n_topics': n_topics, 'max_features': max_features,
+              'mode': mode, 'random_state': random_state}
+    path = os.path.join(model_dir, model_key(data_path, column, **params) + '.joblib')
+
+    def fit():
+        if base is not None and base.params == params and mode == 'minibatch':
+            return copy.deepcopy(base).update(texts)
+        return TopicModel(**params).fit(texts)
+
+    return artifacts.load_or_build(path, fit)